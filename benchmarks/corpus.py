@@ -0,0 +1,97 @@
+"""
+synthetic perovskite formula corpora covering the grammar cmcl parses
+
+every formula is an A, B, X perovskite written in one of several
+styles, drawn at random:
+
+plain     CsPbI3, MAPbBr3
+decimal   Cs0.1FA0.9Pb(I0.83Br0.17)3
+nested    ((MA0.5FA0.5)0.8Cs0.2)Pb(I0.9Br0.1)3
+symbolic  CsPbI3-xBrx, MA1-xFAxSnI3
+unicode   CsPbI₃, Cs₀.₁FA₀.₉PbI₃
+latex     Cs_{0.1}FA_{0.9}PbI_3
+
+corpus(n, distinct=...) repeats a pool of distinct formulas, as real
+tables do, so the parse cache is exercised like it is in practice.
+"""
+import numpy as np
+
+A = ["MA", "FA", "Cs", "Rb", "K"]
+B = ["Pb", "Sn", "Ge"]
+X = ["I", "Br", "Cl"]
+
+styles = ["plain", "decimal", "nested", "symbolic", "unicode", "latex"]
+
+subscripts = str.maketrans("0123456789", "₀₁₂₃₄₅₆₇₈₉")
+
+def _num(value):
+    """shortest decimal of value, empty for 1"""
+    return "" if value == 1 else f"{value:g}"
+
+def _fractions(rng, k):
+    """k fractions of two decimals summing to 1"""
+    cuts = np.sort(rng.choice(np.arange(1, 100), k-1, replace=False))
+    return np.diff(np.concatenate([[0], cuts, [100]])) / 100
+
+def _mix(rng, members, k):
+    """members mixed in k random fractions, ie Cs0.1FA0.9"""
+    picks = rng.choice(members, k, replace=False)
+    return "".join(f"{sym}{_num(frac)}" for sym, frac in zip(picks, _fractions(rng, k)))
+
+def _site(rng, members, total, k):
+    """one site holding total, mixed over k members, grouped when needed"""
+    if k == 1:
+        return f"{rng.choice(members)}{_num(total)}"
+    if total == 1:
+        return _mix(rng, members, k)
+    return f"({_mix(rng, members, k)}){_num(total)}"
+
+def formula(rng, style):
+    """one random formula in style"""
+    if style == "plain":
+        return f"{rng.choice(A)}{rng.choice(B)}{rng.choice(X)}3"
+    if style == "nested":
+        inner = _mix(rng, A[:2], 2)
+        outer = rng.choice(A[2:])
+        frac = _fractions(rng, 2)
+        return f"(({inner}){_num(frac[0])}{outer}{_num(frac[1])}){rng.choice(B)}{_site(rng, X, 3, 2)}"
+    if style == "symbolic":
+        if rng.random() < 0.5:
+            x1, x2 = rng.choice(X, 2, replace=False)
+            return f"{rng.choice(A)}{rng.choice(B)}{x1}3-x{x2}x"
+        a1, a2 = rng.choice(A, 2, replace=False)
+        return f"{a1}1-x{a2}x{rng.choice(B)}{rng.choice(X)}3"
+    ka, kb, kx = rng.integers(1, 3, size=3)
+    entry = _site(rng, A, 1, ka) + _site(rng, B, 1, kb) + _site(rng, X, 3, kx)
+    if style == "unicode":
+        return entry.translate(subscripts)
+    if style == "latex":
+        # subscripts as _{n}, and _n where n is one character
+        out, i = [], 0
+        while i < len(entry):
+            if entry[i].isdigit() or entry[i] == ".":
+                j = i
+                while j < len(entry) and (entry[j].isdigit() or entry[j] == "."):
+                    j += 1
+                num = entry[i:j]
+                out.append(f"_{num}" if len(num) == 1 else f"_{{{num}}}")
+                i = j
+            else:
+                out.append(entry[i])
+                i += 1
+        return "".join(out)
+    return entry
+
+def corpus(n, distinct=None, seed=0, weights=None):
+    """
+    list of n formulas, drawn from a pool of distinct formulas (n by
+    default). weights are the probabilities of styles, uniform by
+    default
+    """
+    rng = np.random.default_rng(seed)
+    distinct = n if distinct is None else min(distinct, n)
+    chosen = rng.choice(styles, distinct, p=weights)
+    pool = [formula(rng, style) for style in chosen]
+    if distinct == n:
+        return pool
+    return [pool[i] for i in rng.integers(0, distinct, n)]
@@ -0,0 +1,160 @@
+"""
+offline benchmarks of cmcl's featurization pipeline
+
+times ft.comp(), make_possible_compositions, Categories.logif and
+collect.abx() at increasing sizes on synthetic corpora, recording the
+best wall time of several repeats, throughput and peak traced memory.
+results are written as json, tagged with the commit and library
+versions, so runs on different commits can be compared:
+
+python benchmarks/run.py -o before.json
+git checkout other-branch
+python benchmarks/run.py -o after.json --compare before.json
+"""
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cmcl
+import cmcl.data
+from cmcl import Categories, make_possible_compositions
+from cmcl.data.cache import disable_cache
+from cmcl.features._extract_constituents import parse_formula
+
+from corpus import corpus
+
+def measure(setup, func, repeat):
+    """
+    best wall time of repeat calls of func(setup()) and the peak
+    memory traced during one more call. setup is not timed
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    arg = setup()
+    gc.collect()
+    tracemalloc.start()
+    func(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+def formula_frame(n, distinct):
+    return pd.DataFrame({"Formula": corpus(n, distinct=distinct)})
+
+def bench_comp(n, repeat, distinct=0.1):
+    """ft.comp() of n formulas with a cold parse cache, distinct is the fraction of distinct formulas"""
+    df = formula_frame(n, max(1, int(n*distinct)))
+    def setup():
+        parse_formula.cache_clear()
+        # a new frame, so its accessor holds no table yet
+        return df.copy()
+    return measure(setup, lambda df: df.ft.comp(), repeat)
+
+def bench_possible(supercell_size, repeat):
+    """make_possible_compositions of six constituents"""
+    constituents = ["MA", "FA", "Cs", "Pb", "Sn", "I"]
+    func = lambda _: make_possible_compositions(constituents, 1, supercell_size)
+    return measure(lambda: None, func, repeat)
+
+def bench_logif(n, repeat, vectorized=True):
+    """Categories.logif over the composition table of n formulas"""
+    comp = formula_frame(n, max(1, n//10)).ft.comp().fillna(0)
+    func = lambda df: Categories.logif(df, lambda x: x > 0.5, default="none",
+                                       vectorized=vectorized)
+    return measure(lambda: comp, func, repeat)
+
+def bench_abx(n, repeat):
+    """collect.abx() over the composition table of n formulas"""
+    comp = formula_frame(n, max(1, n//10)).ft.comp().fillna(0)
+    return measure(lambda: comp.copy(), lambda df: df.collect.abx(), repeat)
+
+def suite(sizes, repeat):
+    """(benchmark, size, rows, seconds, peak bytes) of every benchmark"""
+    cases = []
+    for n in sizes:
+        cases.append(("comp", n, n, lambda n=n: bench_comp(n, repeat)))
+        cases.append(("logif", n, n, lambda n=n: bench_logif(n, repeat)))
+        if n <= 10000:
+            # the row-wise path is far slower, keep it to small sizes
+            cases.append(("logif_rowwise", n, n, lambda n=n: bench_logif(n, repeat, False)))
+        cases.append(("abx", n, n, lambda n=n: bench_abx(n, repeat)))
+    for supercell_size in [4, 8, 16, 32]:
+        rows = len(make_possible_compositions(["MA", "FA", "Cs", "Pb", "Sn", "I"], 1, supercell_size))
+        if rows > 10*max(sizes):
+            break
+        cases.append(("possible_compositions", supercell_size, rows,
+                      lambda s=supercell_size: bench_possible(s, repeat)))
+    results = []
+    for name, size, rows, run in cases:
+        seconds, peak = run()
+        results.append({"benchmark": name, "size": size, "rows": rows,
+                        "seconds": seconds, "rows_per_s": rows/seconds,
+                        "peak_bytes": peak})
+        print(f"{name:>22} {size:>8} {seconds*1000:10.2f} ms "
+              f"{rows/seconds:12.0f} rows/s {peak/2**20:8.1f} MiB", file=sys.stderr)
+    return results
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit or None,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cmcl": cmcl.__version__,
+            "pandas": pd.__version__,
+            "numpy": np.__version__}
+
+def compare(results, baseline):
+    """ratio of baseline to current time of every benchmark in both, above 1 is faster now"""
+    old = {(r["benchmark"], r["size"]): r["seconds"] for r in baseline["results"]}
+    print(f"compared to {baseline['meta'].get('commit')}", file=sys.stderr)
+    for r in results:
+        key = (r["benchmark"], r["size"])
+        if key in old:
+            print(f"{r['benchmark']:>22} {r['size']:>8} {old[key]/r['seconds']:8.2f}x",
+                  file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="smallest size only, one repeat")
+    parser.add_argument("-o", "--output", default="-", help="json results, - for stdout")
+    parser.add_argument("--compare", help="json results of an earlier run")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.sizes, args.repeat = [1000], 1
+    disable_cache()
+    report = {"meta": metadata(), "results": suite(args.sizes, args.repeat)}
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report["results"], json.load(f))
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=1)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+if __name__ == "__main__":
+    main()
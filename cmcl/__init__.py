@@ -1,8 +1,20 @@
 __version__ = '0.1.5'
 
-from . import data
-from .features import Categories, make_possible_compositions
+from ._lazy import lazy, when_imported
 
 __all__ = ["data",
            "Categories",
            "make_possible_compositions"]
+
+# nothing heavy is imported until it is used
+__getattr__, __dir__ = lazy(__name__, ["data", "db", "features", "models", "profiling"],
+                            {"Categories": ".features",
+                             "make_possible_compositions": ".features"})
+
+# importing cmcl.data registers the ft and collect accessors. do it as
+# soon as pandas is loaded, so import cmcl enables them without paying
+# for pandas itself
+def _register_accessors():
+    from . import data
+
+when_imported("pandas", _register_accessors)
@@ -0,0 +1,60 @@
+"""deferred imports for cmcl's packages"""
+import sys
+import importlib
+
+def lazy(package, submodules=(), names=None):
+    """
+    module level __getattr__ and __dir__ (PEP 562) for package that
+    import submodules, and names from submodules, on first access.
+
+    __getattr__, __dir__ = lazy(__name__, ["data"], {"Categories": ".features"})
+    """
+    names = names or {}
+
+    def __getattr__(name):
+        if name in submodules:
+            return importlib.import_module(f".{name}", package)
+        if name in names:
+            value = getattr(importlib.import_module(names[name], package), name)
+            # later lookups skip __getattr__
+            setattr(importlib.import_module(package), name, value)
+            return value
+        raise AttributeError(f"module {package!r} has no attribute {name!r}")
+
+    def __dir__():
+        return sorted(set(vars(importlib.import_module(package))) | set(submodules) | set(names))
+
+    return __getattr__, __dir__
+
+class _AfterImport():
+    """finder that runs callback once module name has been executed"""
+    def __init__(self, name, callback):
+        self.name = name
+        self.callback = callback
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname != self.name:
+            return None
+        sys.meta_path.remove(self)
+        for finder in sys.meta_path:
+            find_spec = getattr(finder, "find_spec", None)
+            spec = find_spec and find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is None:
+            return spec
+        exec_module = spec.loader.exec_module
+        def exec_then_call(module):
+            exec_module(module)
+            self.callback()
+        spec.loader.exec_module = exec_then_call
+        return spec
+
+def when_imported(name, callback):
+    """call callback after module name is imported, now if it already is"""
+    if name in sys.modules:
+        callback()
+    else:
+        sys.meta_path.insert(0, _AfterImport(name, callback))
@@ -0,0 +1,57 @@
+import click
+
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.argument("roots", nargs=-1, type=click.Path(exists=True, file_okay=False))
+@click.option("--db", "dbpath", default="cmcl.db", show_default=True,
+              help="sqlite database to commit results to")
+@click.option("--table", "tblname", default="calcs", show_default=True)
+@click.option("--batchsize", default=1000, show_default=True,
+              help="runs committed per transaction")
+def gather(roots, dbpath, tblname, batchsize):
+    """Crawls directories for DFT inputs/outputs and commits them to a database"""
+    from cmcl.data.gather import gather
+    df = gather(roots or ["."], dbpath, tblname, batchsize=batchsize)
+    click.echo(f"{len(df)} new or changed runs committed to {dbpath}:{tblname}")
+
+@cli.command()
+@click.argument("model", type=click.Path(exists=True, dir_okay=False))
+@click.argument("formulas", type=click.File("r"), default="-")
+@click.option("--output", "-o", type=click.File("w"), default="-",
+              help="csv of formula and predictions")
+@click.option("--batchsize", default=65536, show_default=True,
+              help="formulas featurized and predicted at once")
+def predict(model, formulas, output, batchsize):
+    """Predicts properties of formulas, one per line, with a persisted model"""
+    from cmcl.models import Predictor
+    predictor = Predictor.load(model)
+    for i, batch in enumerate(predictor.stream(formulas, batchsize)):
+        batch.to_csv(output, header=(i == 0), index=False)
+
+@cli.command()
+@click.argument("models", nargs=-1, required=True)
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8000, show_default=True)
+@click.option("--max-batch", default=256, show_default=True,
+              help="most formulas predicted at once")
+@click.option("--max-wait", default=2.0, show_default=True,
+              help="ms a batch waits to fill after its first formula")
+def serve(models, host, port, max_batch, max_wait):
+    """Serves persisted models over HTTP, each given as NAME=PATH or PATH"""
+    import os
+    import asyncio
+    from cmcl.models import Predictor, PredictionServer
+    predictors = {}
+    for model in models:
+        name, _, path = model.rpartition("=")
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        predictors[name] = Predictor.load(path)
+    server = PredictionServer(predictors, max_batch, max_wait/1000)
+    click.echo(f"serving {', '.join(predictors)} on http://{host}:{port}")
+    asyncio.run(server.serve(host, port))
+
+if __name__ == "__main__":
+    cli()
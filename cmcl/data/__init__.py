@@ -1,5 +1,10 @@
+from cmcl._lazy import lazy
+
+# registers the ft and collect accessors
 from .frame import FeatureAccessor
 from .frame import CollectionAccessor
 
 __all__ = ["ft",
            "collect"]
+
+__getattr__, __dir__ = lazy(__name__, ["base", "cache", "gather", "index", "stream"])
@@ -1,8 +1,12 @@
 import pandas as pd
+import numpy as np
 import sqlite3
 import os
 
-from cmcl.db.access import get_session
+from sqlalchemy import text
+
+from cmcl.db.access import get_engine
+from cmcl.features._extract_constituents import parse_formulas
 
 # this whole thing probably needs to be tossed.  I'm still not sure
 # how I'll give users an option to write their tables to a database
@@ -12,6 +16,84 @@ from cmcl.db.access import get_session
 
 # collab-scale database sharing is mostly figured out....
 
+hash_col = "cmcl_hash"
+
+members_suffix = "elements"
+members_table = "cmcl_members"
+# rowid of rows read for filtering, dropped before returning
+rowid_col = "cmcl_rowid"
+# separates hashes of fractional floats from those of integers
+_float_salt = np.uint64(0x9e3779b97f4a7c15)
+
+pragmas = {"journal_mode": "WAL",
+           "synchronous": "NORMAL",
+           "temp_store": "MEMORY",
+           "cache_size": -2**16,
+           "mmap_size": 2**28}
+
+def connect(filename: str, timeout: float=30.):
+    """
+    sqlite connection with cmcl's pragmas. WAL lets readers proceed
+    while a writer commits, synchronous=NORMAL only syncs at
+    checkpoints, which is safe in WAL mode
+    """
+    conn = sqlite3.connect(os.path.expanduser(filename), timeout=timeout)
+    for pragma, value in pragmas.items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+    return conn
+
+def _sql_type(dtype):
+    """sqlite column affinity of a pandas dtype"""
+    if dtype.kind in "iub":
+        return "INTEGER"
+    if dtype.kind == "f":
+        return "REAL"
+    return "TEXT"
+
+def content_hash(df):
+    """
+    signed 64 bit hash of the values of each row of df, independent of
+    its index, fit for an sqlite INTEGER column.
+
+    each row is hashed as the set of its (column, value) pairs, leaving
+    out missing values, like the row sqlite stores: the order of the
+    columns does not matter, the same values under other columns hash
+    differently, and a column missing from df hashes like a null.
+
+    values are hashed in the form sqlite stores them, not by dtype:
+    integral numbers as integers, whether they came as int64, Int64 or
+    float64 because some other row of the frame was missing a value,
+    other numbers as floats and everything else as text
+    """
+    total = np.zeros(len(df), dtype=np.uint64)
+    for col, values in df.items():
+        present = values.notna().to_numpy()
+        hashes = np.zeros(len(df), dtype=np.uint64)
+        if pd.api.types.is_numeric_dtype(values.dtype) and values.dtype.kind != "f":
+            ints = values.to_numpy(dtype=np.int64, na_value=0)
+            hashes = pd.util.hash_array(ints)
+        elif pd.api.types.is_numeric_dtype(values.dtype):
+            floats = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            with np.errstate(invalid="ignore"):
+                integral = (np.rint(floats) == floats) & (np.abs(floats) < 2.**63)
+            hashes[integral] = pd.util.hash_array(floats[integral].astype(np.int64))
+            # kept apart from integers sharing their bits
+            hashes[~integral] = pd.util.hash_array(floats[~integral]) ^ _float_salt
+        else:
+            hashes = pd.util.hash_array(values.astype(object).to_numpy())
+        name = pd.util.hash_array(np.array([str(col)], dtype=object))[0]
+        # pairs are mixed, then summed so their order does not matter
+        with np.errstate(over="ignore"):
+            total += np.where(present, pd.util.hash_array(hashes ^ name), np.uint64(0))
+    return total.view(np.int64)
+
+def _elements(formulas):
+    """constituents of each formula, parsing each distinct formula once"""
+    codes, uniques = pd.factorize(pd.Series(formulas, dtype=object))
+    elements = [[el for el, amt in compdict.items() if not amt == 0]
+                for compdict in parse_formulas(uniques)]
+    return [elements[code] if code >= 0 else [] for code in codes]
+
 class UserDatabase():
     """
     creates and accesses user's own database. use storage accessor to
@@ -24,30 +106,220 @@ class UserDatabase():
 
 class DataRetriever():
     """
-    get tables from database
+    get tables from database.
+
+    query pushes column selection and row filters down into SQL, so only
+    the rows and columns asked for are ever read. all Sn containing
+    iodides with an HSE gap:
+
+    dr = DataRetriever("~/perovskites.db", "mannodi_agg")
+    dr.query(columns=["Formula", "HSE_bg_eV"], formula="*I3",
+             elements=["Sn"], ranges={"HSE_bg_eV": (None, None)})
+
+    queries never write to the database, so read only databases can be
+    queried. element filters parse the formula of every row unless
+    index_elements() has built a side table of (element, row) pairs,
+    which later calls extend with the rows appended since. rows past
+    the side table are still parsed. index() adds indexes for
+    frequently filtered columns. both need write access, once.
     """
-    def __init__(self, filename: str, tblname: str):
-        self._conn = sqlite3.connect(os.expanduser(filename))
+    def __init__(self, filename: str, tblname: str,
+                 index_col: str="index", formula_col: str="Formula"):
+        self._engine = get_engine(filename)
         self._tbl = tblname
+        self._members = f"{tblname}_{members_suffix}"
+        self.index_col = index_col
+        self.formula_col = formula_col
+
+    def index(self, *columns):
+        """create indexes on columns, the formula column by default"""
+        with self._engine.begin() as conn:
+            for col in columns or (self.formula_col,):
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{self._tbl}_{col}" '
+                                  f'ON "{self._tbl}" ("{col}")'))
+
+    def index_elements(self, chunksize: int=50000):
+        """create the element membership table, or extend it with new rows"""
+        with self._engine.begin() as conn:
+            conn.execute(text(f'''CREATE TABLE IF NOT EXISTS "{self._members}"
+                                   (element TEXT, row INTEGER, PRIMARY KEY (element, row))
+                                   WITHOUT ROWID'''))
+            conn.execute(text(f'''CREATE TABLE IF NOT EXISTS "{members_table}"
+                                   (tbl TEXT PRIMARY KEY, last INTEGER)'''))
+            # the table only grows, so rows past the last seen rowid are new
+            last = conn.execute(text(f'SELECT last FROM "{members_table}" WHERE tbl = :tbl'),
+                                {"tbl": self._tbl}).scalar() or 0
+            newest = conn.execute(text(f'SELECT max(rowid) FROM "{self._tbl}"')).scalar() or 0
+            if newest <= last:
+                return
+            rows = conn.execute(text(f'''SELECT rowid, "{self.formula_col}" FROM "{self._tbl}"
+                                          WHERE rowid > :last AND rowid <= :newest
+                                          AND "{self.formula_col}" IS NOT NULL'''),
+                                {"last": last, "newest": newest}).fetchall()
+            insert = f'INSERT OR IGNORE INTO "{self._members}" VALUES (?, ?)'
+            for start in range(0, len(rows), chunksize):
+                rowids, formulas = zip(*rows[start:start+chunksize])
+                members = [(el, rowid) for rowid, elements in zip(rowids, _elements(formulas))
+                           for el in elements]
+                if members:
+                    # plain DBAPI executemany, skips per row parameter compilation
+                    conn.exec_driver_sql(insert, members)
+            conn.execute(text(f'INSERT OR REPLACE INTO "{members_table}" VALUES (:tbl, :last)'),
+                         {"tbl": self._tbl, "last": newest})
+
+    def query(self, columns: list=None, formula=None, elements: list=None,
+              ranges: dict=None)->pd.DataFrame:
+        """
+        rows of the table matching every filter given, indexed by index_col
+
+        columns: columns to read, all by default
+        formula: glob pattern, or list of patterns of which one must
+        match the formula, ie "*I3". case sensitive
+        elements: constituents every row must contain, ie ["Sn", "I"]
+        ranges: {column: (low, high)} of inclusive bounds, None is
+        unbounded. (None, None) only excludes nulls
+        """
+        clauses, params = [], {}
+        if formula is not None:
+            patterns = [formula] if isinstance(formula, str) else list(formula)
+            params.update({f"f{i}": pattern for i, pattern in enumerate(patterns)})
+            clauses.append("(" + " OR ".join(f'"{self.formula_col}" GLOB :f{i}'
+                                             for i in range(len(patterns))) + ")")
+        last, matched = 0, None
+        if elements:
+            elements = sorted(set(elements))
+            with self._engine.connect() as conn:
+                last = self._indexed(conn)
+                # rows past the membership table are checked by parsing
+                rows = conn.execute(text(f'''SELECT rowid, "{self.formula_col}" FROM "{self._tbl}"
+                                              WHERE rowid > :last'''), {"last": last}).fetchall()
+            rowids, formulas = zip(*rows) if rows else ((), ())
+            matched = [rowid for rowid, members in zip(rowids, _elements(formulas))
+                       if set(elements) <= set(members)]
+            if last:
+                params.update({f"e{i}": el for i, el in enumerate(elements)})
+                params["last"] = last
+                clauses.append(f'''(rowid IN (SELECT row FROM "{self._members}"
+                                               WHERE element IN ({", ".join(f":e{i}" for i in range(len(elements)))})
+                                               GROUP BY row HAVING count(*) = {len(elements)})
+                                    OR rowid > :last)''')
+        for i, (col, (low, high)) in enumerate((ranges or {}).items()):
+            if low is None and high is None:
+                clauses.append(f'"{col}" IS NOT NULL')
+            if low is not None:
+                clauses.append(f'"{col}" >= :low{i}')
+                params[f"low{i}"] = low
+            if high is not None:
+                clauses.append(f'"{col}" <= :high{i}')
+                params[f"high{i}"] = high
+        if columns is None:
+            select = "*"
+        else:
+            select = ", ".join(f'"{col}"' for col in
+                               [self.index_col, *(col for col in columns if col != self.index_col)])
+        if matched is not None:
+            select = f'rowid AS "{rowid_col}", {select}'
+        sql_string = f'SELECT {select} FROM "{self._tbl}"'
+        if clauses:
+            sql_string += " WHERE " + " AND ".join(clauses)
+        with self._engine.connect() as conn:
+            df = pd.read_sql(text(sql_string), conn, params=params, index_col=self.index_col)
+        if matched is not None:
+            rowids = df.pop(rowid_col)
+            df = df[((rowids <= last) | rowids.isin(matched)).to_numpy()]
+        return df.drop(columns=hash_col, errors="ignore")
+
+    def _indexed(self, conn)->int:
+        """last rowid covered by the element membership table, 0 without one"""
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                              {"name": members_table}).scalar()
+        if not exists:
+            return 0
+        return conn.execute(text(f'SELECT last FROM "{members_table}" WHERE tbl = :tbl'),
+                            {"tbl": self._tbl}).scalar() or 0
 
     def read(self):
-        sql_string = f"""SELECT *
-                         FROM {self._tbl}"""
-        df = pd.read_sql(tblname,
-                         self._conn, 
-                         index_col='index')
-        self._conn.close()
+        """the whole table"""
+        return self.query()
 
 class DataStasher():
     """
-    put table into database
+    append tables to a database. rows are never updated or replaced.
+
+    the database is opened in WAL mode, so readers are not blocked
+    while a write is in progress. rows are inserted in transactions of
+    batchsize rows and deduplicated against a unique index on a hash
+    of their content, so writing the same rows twice stores them once.
+    columns the table does not have yet are added to it.
+
+    stash = DataStasher("~/cmcl.db", "mannodi_agg")
+    stash.write(df)
     """
-    def __init__(self, filename: str, tblname: str, df):
-        self._conn = sqlite3.connect(os.expanduser(filename))
+    def __init__(self, filename: str, tblname: str, batchsize: int=50000):
+        self._conn = connect(filename)
         self._tbl = tblname
+        self.batchsize = batchsize
 
-    def read(self):
-        df = pd.read_sql(self._tbl,
-                         self._conn, 
-                         if_exists='replace')
+    def _columns(self):
+        """columns of the table, empty if it does not exist"""
+        return [row[1] for row in self._conn.execute(f'PRAGMA table_info("{self._tbl}")')]
+
+    def _prepare(self, df):
+        """
+        create the table, or add the columns of df it lacks. tables
+        written by other means gain the hash column, their old rows are
+        left unhashed. returns whether the table was created
+        """
+        existing = self._columns()
+        types = {col: _sql_type(dtype) for col, dtype in df.dtypes.items()}
+        with self._conn:
+            if not existing:
+                columns = ", ".join(f'"{col}" {sqltype}' for col, sqltype in types.items())
+                self._conn.execute(f'CREATE TABLE "{self._tbl}" ({columns})')
+            else:
+                for col in [col for col in types if col not in existing]:
+                    self._conn.execute(f'ALTER TABLE "{self._tbl}" ADD COLUMN "{col}" {types[col]}')
+        return not existing
+
+    def _index(self):
+        """unique index on the content hash"""
+        with self._conn:
+            self._conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{self._tbl}_{hash_col}" '
+                               f'ON "{self._tbl}" ("{hash_col}")')
+
+    def write(self, df)->int:
+        """
+        append the rows of df, with its index as a column like
+        DataFrame.to_sql. returns the number of rows that were new
+        """
+        values = list(df.columns)
+        # an unnamed index becomes "index", or "level_0" when df already
+        # has an index column
+        df = df.reset_index()
+        for col, dtype in df.dtypes.items():
+            # sqlite3 binds python scalars only, not timestamps
+            if dtype.kind in "mM":
+                df[col] = df[col].astype(str).where(df[col].notna(), None)
+        df[hash_col] = content_hash(df[values])
+        if self._prepare(df):
+            # bulk load a new table, then index it in one pass
+            df = df[~df[hash_col].duplicated()]
+        else:
+            self._index()
+        for col, dtype in df.dtypes.items():
+            # nor pd.NA
+            if not isinstance(dtype, np.dtype):
+                df[col] = df[col].astype(object).where(df[col].notna(), None)
+        columns = ", ".join(f'"{col}"' for col in df.columns)
+        insert = (f'INSERT OR IGNORE INTO "{self._tbl}" ({columns}) '
+                  f'VALUES ({", ".join("?"*len(df.columns))})')
+        before = self._conn.total_changes
+        for start in range(0, len(df), self.batchsize):
+            batch = df.iloc[start:start+self.batchsize]
+            with self._conn:
+                self._conn.executemany(insert, batch.itertuples(index=False, name=None))
+        self._index()
+        return self._conn.total_changes - before
+
+    def close(self):
         self._conn.close()
@@ -0,0 +1,138 @@
+"""
+persistent, content-addressed cache of feature tables
+
+opt in with enable_cache() or by setting CMCL_CACHE_DIR. tables are
+keyed by a hash of the formula column, the cmcl version, the source of
+the featurizers, and the featurizer's parameters, so they are shared
+between frames, copies and sessions holding the same formula, and are
+invalidated whenever the parser changes. tables are stored as parquet
+and the least recently used are evicted past a size limit.
+"""
+import os
+import glob
+import hashlib
+import tempfile
+import pandas as pd
+
+import cmcl
+from cmcl.features import _extract_constituents, _extract_metrics
+from cmcl.profiling import stage
+
+_cache = None
+# set by disable_cache(), so CMCL_CACHE_DIR does not reopen the cache
+_disabled = object()
+
+def _fingerprint():
+    """hash of cmcl's version and the source of its featurizers"""
+    h = hashlib.sha256(cmcl.__version__.encode())
+    for module in (_extract_constituents, _extract_metrics):
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+class FeatureCache():
+    """
+    directory of feature tables. each file is named for the featurizer
+    fingerprint and the table's key. files from other fingerprints
+    are removed when the cache is opened.
+    """
+    def __init__(self, path, max_bytes=2**30):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.fingerprint = _fingerprint()
+        os.makedirs(self.path, exist_ok=True)
+        for stale in glob.glob(os.path.join(self.path, "*.parquet")):
+            if not os.path.basename(stale).startswith(self.fingerprint):
+                os.remove(stale)
+
+    def key(self, formula, kind, **params):
+        """hash of a formula series, the kind of table, and its parameters"""
+        h = hashlib.sha256(f"{kind}{sorted(params.items())}".encode())
+        h.update(pd.util.hash_pandas_object(formula, index=False).to_numpy().tobytes())
+        return h.hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{self.fingerprint}-{key}.parquet")
+
+    def load(self, key):
+        """cached table or None. marks the table as recently used"""
+        path = self._file(key)
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return df
+
+    def store(self, key, df):
+        """write table atomically, then evict down to max_bytes"""
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        os.close(fd)
+        try:
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, self._file(key))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def evict(self):
+        """remove least recently used tables until the cache fits"""
+        entries = []
+        for path in glob.glob(os.path.join(self.path, "*.parquet")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.path, "*.parquet")):
+            os.remove(path)
+
+def enable_cache(path="~/.cache/cmcl", max_bytes=2**30):
+    """cache feature tables in path, holding at most max_bytes"""
+    global _cache
+    _cache = FeatureCache(path, max_bytes)
+    return _cache
+
+def disable_cache():
+    """stop caching, even when CMCL_CACHE_DIR is set, until enable_cache()"""
+    global _cache
+    _cache = _disabled
+
+def get_cache():
+    """the active cache, opening CMCL_CACHE_DIR on first use if set"""
+    if _cache is None and os.environ.get("CMCL_CACHE_DIR"):
+        enable_cache(os.environ["CMCL_CACHE_DIR"])
+    return None if _cache is _disabled else _cache
+
+def cached(formula, kind, make, index, regen=False, **params):
+    """
+    table of the given kind for a formula series, from the cache when
+    enabled. make computes it on a miss. tables are stored without an
+    index and get index on the way out.
+    """
+    cache = get_cache()
+    if cache is None:
+        return make()
+    with stage("cache.load", rows=len(formula)) as s:
+        key = cache.key(formula, kind, **params)
+        df = None if regen else cache.load(key)
+        s.count(hits=int(df is not None), misses=int(df is None))
+    if df is None:
+        df = make()
+        with stage("cache.store", rows=len(df)):
+            cache.store(key, df.reset_index(drop=True))
+    else:
+        df.index = index
+    return df
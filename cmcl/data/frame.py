@@ -1,17 +1,16 @@
-import logging
-logfmt = '[%(levelname)s] %(asctime)s - %(message)s'
-logging.basicConfig(level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S", format=logfmt)
-
 import pandas as pd
 import numpy as np
 
-#feature computers
-from cmcl.features._extract_constituents import CompositionTable
+#feature computers and the feature cache are imported on first use, so
+#registering the accessors costs no more than importing pandas
 
 #metadata handling
 from cmcl.data.index import ColumnGrouper
 #Frame transformer might be movable to cmcl.data.index
 
+#opt-in stage timing, see cmcl.profiling
+from cmcl.profiling import stage
+
 @pd.api.extensions.register_dataframe_accessor("ft")
 class FeatureAccessor():
     """
@@ -20,6 +19,8 @@ class FeatureAccessor():
 
     basic chemical descriptors:
     composition_tbl = CmclFrame.ft.comp()
+    symbolic_tbl = CmclFrame.ft.sym()
+    matched_tbl = CmclFrame.ft.join_on_composition(OtherFrame)
     prop_tbl = CmclFrame.ft.mrg()
     
     pymatgen descriptors:
@@ -34,6 +35,7 @@ class FeatureAccessor():
         #working original
         self._df = df
         self._compdf = None
+        self._mrgdf = None
         
     @staticmethod
     def _validate(df):
@@ -47,16 +49,118 @@ class FeatureAccessor():
     def base(self):
         return self._df
         
-    def comp(self, regen=False):
+    def comp(self, regen=False, output="frame", executor=None, chunksize=None):
         """
         Default call accesses or creates composition table.
         call with regen=True to regenerate existing composition table
+
+        tables are also kept on disk between sessions once
+        cmcl.data.cache.enable_cache() is called
+
+        formula can be parsed in parallel chunks by passing any
+        concurrent.futures.Executor and/or a chunksize. a chunksize
+        alone uses a process pool.
+
+        output="dense" or output="sparse" instead fill a float ndarray
+        or scipy CSR matrix directly. Its columns follow cmcl's fixed
+        constituent vocabulary, so it can be passed straight to
+        scikit-learn as X. These are not cached.
+        """
+        from cmcl.features._extract_constituents import CompositionTable
+        with stage("ft.comp", rows=len(self._df)):
+            if output == "frame":
+                if self._compdf is None or regen:
+                    from cmcl.data.cache import cached
+                    feature = CompositionTable(self._df, executor, chunksize)
+                    self._compdf = cached(feature.Formula, "comp", feature.get,
+                                          self._df.index, regen)
+                return self._compdf
+            elif output in ("dense", "sparse"):
+                feature = CompositionTable(self._df, executor, chunksize)
+                return feature.matrix(sparse=(output == "sparse"))
+            else:
+                raise ValueError(f"output must be one of 'frame', 'dense', 'sparse', not {output!r}")
+
+    def validate(self):
+        """
+        check Formula against the grammar without parsing. returns a
+        boolean Series of accepted rows and a report of rejected rows:
+        their formula, the offset of the first character not accepted
+        in its normalized form, that character and the reason
+        """
+        from cmcl.features._extract_constituents import CompositionTable
+        mask, report = CompositionTable(self._df).validate()
+        return pd.Series(mask, index=self._df.index, name="valid"), report
+
+    def key(self, tolerance=1e-4):
+        """
+        canonical composition key of every record, equal for records of
+        the same composition however written, see composition_keys
+        """
+        from cmcl.features._extract_constituents import CompositionTable
+        return CompositionTable(self._df).keys(tolerance)
+
+    def join_on_composition(self, other, how="inner", tolerance=1e-4, keep="first",
+                            suffixes=("", "_other")):
+        """
+        join records of other frame to these by composition key in one
+        hash join, ie experimental records to DFT records.
+
+        other is deduplicated by key first, keeping its first record or
+        its last with keep="last", so every record here gets at most one
+        match. keep=None joins every match. how is "inner" or "left".
+        records without a key never match. named index levels of other
+        are kept as columns, the key is kept as composition_key
+        """
+        if how not in ("inner", "left"):
+            raise ValueError(f"how must be 'inner' or 'left', not {how!r}")
+        with stage("ft.join_on_composition", rows=len(self._df) + len(other)):
+            right = other.reset_index() if any(other.index.names) else other
+            rkeys = other.ft.key(tolerance).array
+            keyed = ~rkeys.isna()
+            right = right[keyed]
+            right.index = pd.Index(rkeys[keyed], name="composition_key")
+            if keep is not None:
+                right = right[~right.index.duplicated(keep=keep)]
+            left = self._df.assign(composition_key=self.key(tolerance).array)
+            return left.join(right, on="composition_key", how=how,
+                             lsuffix=suffixes[0], rsuffix=suffixes[1])
+
+    def sym(self):
+        """
+        side table of symbolic amounts (x, y, z) left nan in comp().
+        one row per record and constituent, one column of coefficients
+        per term
         """
-        if self._compdf is None or regen:
-            feature = CompositionTable(self._df)
-            self._compdf = feature.get()
-        return self._compdf
+        from cmcl.features._extract_constituents import CompositionTable
+        return CompositionTable(self._df).symbolic()
+
+    def expand(self, **values):
+        """
+        compositions of every symbolic record evaluated over arrays of
+        symbol values, ie CmclFrame.ft.expand(x=np.linspace(0, 1, 11))
+        """
+        from cmcl.features._extract_constituents import CompositionTable
+        return CompositionTable(self._df).expand(**values)
             
+    def mrg(self, regen=False):
+        """
+        access or create table of mean, min, max and range of elemental
+        properties over each record's composition. see MRGTable
+        """
+        from cmcl.features._extract_constituents import CompositionTable, vocabulary
+        from cmcl.features._extract_metrics import MRGTable
+        from cmcl.data.cache import cached
+        with stage("ft.mrg", rows=len(self._df)):
+            if self._mrgdf is None or regen:
+                feature = CompositionTable(self._df)
+                def make():
+                    compdf = pd.DataFrame(feature.matrix(), columns=vocabulary,
+                                          index=self._df.index)
+                    return MRGTable(compdf).get()
+                self._mrgdf = cached(feature.Formula, "mrg", make, self._df.index, regen)
+            return self._mrgdf
+
     def mtmr(self):
         """as above, get array of dscribe inorganic crystal properties"""
         raise NotImplementedError("matminer Not Implemented")
@@ -0,0 +1,148 @@
+"""
+aggregate VASP runs from experiment directory trees into a local
+sqlite database
+
+every directory holding an OUTCAR is one run. a manifest of each run's
+OUTCAR size, modification time and content hash is kept alongside the
+results, so later gathers only hash runs whose size or mtime changed
+and only re-parse runs whose content changed. results are keyed by run
+and content hash, so a re-run calculation adds a row rather than
+replacing its old one.
+
+example:
+gather(["./experiments"], "cmcl.db")
+"""
+import os
+import hashlib
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from cmcl.features._files import executor_or_threads
+from cmcl.features._extract_outcar import read_outcar, outcar_name, outcar_dtypes
+from cmcl.features._extract_metrics import read_cell, structure_names
+
+manifest_table = "cmcl_manifest"
+
+sql_types = {"float64": "REAL", "Int64": "INTEGER", "boolean": "INTEGER", "bool": "INTEGER"}
+
+def _scan(path):
+    """subdirectories of path, and (path, size, mtime) of its OUTCAR if it has one"""
+    dirs, run = [], None
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.name == outcar_name and entry.is_file():
+                    stat = entry.stat()
+                    run = (path, stat.st_size, stat.st_mtime_ns)
+    except (FileNotFoundError, PermissionError):
+        # removed or unreadable since its parent was scanned
+        pass
+    return dirs, run
+
+def crawl(roots, executor):
+    """
+    (directory, size, mtime) of the OUTCAR of every run under roots.
+    each level of the trees is scanned concurrently on executor
+    """
+    frontier, runs = list(roots), []
+    while frontier:
+        subdirs = []
+        for dirs, run in executor.map(_scan, frontier):
+            subdirs += dirs
+            if run is not None:
+                runs.append(run)
+        frontier = subdirs
+    return sorted(runs)
+
+def hash_file(path, blocksize=2**20):
+    """blake2b hex digest of the content of path"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def read_run(path):
+    """outcar row of the run in directory path, with the formula of its structure"""
+    row = read_outcar(os.path.join(path, outcar_name))
+    row["formula"] = None
+    cell = np.empty((3, 3))
+    for name in structure_names:
+        try:
+            row["formula"] = read_cell(os.path.join(path, name), cell)
+            break
+        except (OSError, ValueError, IndexError):
+            continue
+    return row
+
+def _create(conn, tblname):
+    """create the manifest and results tables if they do not exist"""
+    columns = ", ".join(f'"{col}" {sql_types[dtype]}' for col, dtype in outcar_dtypes.items())
+    with conn:
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS "{manifest_table}"
+                         (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)''')
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS "{tblname}"
+                         (calc TEXT, hash TEXT, formula TEXT, {columns},
+                          UNIQUE (calc, hash))''')
+
+def gather(roots, dbpath, tblname="calcs", executor=None, batchsize=1000):
+    """
+    crawl roots for VASP runs and commit the new and changed ones to
+    tblname in the sqlite database at dbpath.
+
+    runs are hashed and parsed concurrently on executor, any
+    concurrent.futures.Executor, or a thread pool by default. results
+    and their manifest entries are committed together in transactions
+    of batchsize runs, so an interrupted gather resumes where it
+    stopped.
+
+    runs are keyed by their real absolute path, so gathering a tree
+    from anywhere, by any path to it, sees the same runs.
+
+    returns a frame of the runs parsed, indexed by run directory
+    """
+    roots = [os.path.realpath(os.path.expanduser(root)) for root in roots]
+    conn = sqlite3.connect(os.path.expanduser(dbpath))
+    try:
+        with executor_or_threads(executor) as executor:
+            _create(conn, tblname)
+            known = {path: (size, mtime, digest) for path, size, mtime, digest
+                     in conn.execute(f'SELECT path, size, mtime_ns, hash FROM "{manifest_table}"')}
+            # size and mtime are cheap to check, only hash runs that moved
+            stale = [run for run in crawl(roots, executor)
+                     if known.get(run[0], (None, None))[:2] != run[1:]]
+            digests = executor.map(hash_file, [os.path.join(path, outcar_name) for path, _, _ in stale])
+            manifest, changed = {}, []
+            for (path, size, mtime), digest in zip(stale, digests):
+                manifest[path] = (path, size, mtime, digest)
+                if path not in known or known[path][2] != digest:
+                    changed.append((path, digest))
+            columns = ["calc", "hash", "formula", *outcar_dtypes]
+            insert = f'''INSERT OR IGNORE INTO "{tblname}"
+                         ({", ".join(f'"{col}"' for col in columns)})
+                         VALUES ({", ".join("?"*len(columns))})'''
+            upsert = f'INSERT OR REPLACE INTO "{manifest_table}" VALUES (?, ?, ?, ?)'
+            # runs touched but unchanged only need their manifest entry
+            touched = [manifest[path] for path in manifest
+                       if path in known and known[path][2] == manifest[path][3]]
+            with conn:
+                conn.executemany(upsert, touched)
+            records = []
+            for start in range(0, len(changed), batchsize):
+                batch = changed[start:start+batchsize]
+                rows = list(executor.map(read_run, [path for path, _ in batch]))
+                params = [(path, digest, row["formula"],
+                           *(None if pd.isna(row[col]) else row[col] for col in outcar_dtypes))
+                          for (path, digest), row in zip(batch, rows)]
+                with conn:
+                    conn.executemany(insert, params)
+                    conn.executemany(upsert, [manifest[path] for path, _ in batch])
+                records += [dict(row, calc=path, hash=digest)
+                            for (path, digest), row in zip(batch, rows)]
+    finally:
+        conn.close()
+    df = pd.DataFrame(records, columns=columns).set_index("calc")
+    return df.astype(outcar_dtypes)
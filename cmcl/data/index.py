@@ -1,4 +1,43 @@
+import numpy as np
 import pandas as pd
+from functools import lru_cache
+
+@lru_cache(maxsize=128)
+def _invert(segments):
+    """
+    inverted index of segments, given as a tuple of (group, labels)
+    pairs. maps each label to the groups containing it, in segment order
+    """
+    groups_of = {}
+    for k, l in segments:
+        for label in dict.fromkeys(l):
+            groups_of[label] = groups_of.get(label, ()) + (k,)
+    return groups_of
+
+@lru_cache(maxsize=128)
+def _group_columns(columns, segments, dontdrop, name_tuple):
+    """
+    MultiIndex of grouped columns, sorted by group, and the position of
+    each of its entries in columns. cached against the column tuple
+    """
+    groups_of = _invert(segments)
+    column_tuples, positions = [], []
+    for pos, label in enumerate(columns):
+        groups = groups_of.get(label)
+        if groups:
+            column_tuples += [(k, label) for k in groups]
+            positions += [pos] * len(groups)
+        elif dontdrop:
+            column_tuples.append(("undef", label))
+            positions.append(pos)
+    if column_tuples:
+        mi = pd.MultiIndex.from_tuples(column_tuples, names=name_tuple)
+    else:
+        mi = pd.MultiIndex.from_arrays([[], []], names=name_tuple)
+    mi_ordered, indexer = mi.sortlevel(level=0)
+    positions = np.asarray(positions, dtype=np.intp)[indexer]
+    positions.flags.writeable = False
+    return mi_ordered, positions
 
 class ColumnGrouper():
     """
@@ -28,32 +67,30 @@ class ColumnGrouper():
 
     if the same thing need be done for row labels, just transpose the
     dataframe
+
+    label lookups go through an inverted index built once per segment
+    dictionary, and the resulting MultiIndex is cached against the
+    column labels, so regrouping same-shaped frames is nearly free
     """
     def __init__(self, df, segments, dontdrop=True):
         self.df = df
         self.segments = segments
         self.dontdrop = dontdrop
         
-    def _lookup(self, label):
-        anygroup = []
-        for k,l in self.segments.items():
-            anygroup += l
-            if label in l:
-                yield (k, label)
-        if label not in anygroup and self.dontdrop:
-            yield ("undef", label)
-
     def get_groups(self, name_tuple=None):
         """
         returns the dataframe with a MultiIndex
         """
-        column_tuples = []
-        for column_tuplator in map(self._lookup, self.df.columns):
-            column_tuples += list(column_tuplator)
-        mi = pd.MultiIndex.from_tuples(column_tuples,
-                                       names=name_tuple)
-        mi_ordered, _ = mi.sortlevel(level=0)
-        self.df = self.df.reindex(mi_ordered.get_level_values(1), axis=1, copy=False)
-        self.df.columns=mi_ordered
+        segments = tuple((k, tuple(l)) for k, l in self.segments.items())
+        if name_tuple is not None:
+            name_tuple = tuple(name_tuple)
+        mi_ordered, positions = _group_columns(tuple(self.df.columns), segments,
+                                               self.dontdrop, name_tuple)
+        if np.array_equal(positions, np.arange(self.df.shape[1])):
+            # columns are already in order, only relabel them
+            self.df = self.df.copy(deep=False)
+        else:
+            self.df = self.df.take(positions, axis=1)
+        # a fresh index per call, so renaming its levels spares the cache
+        self.df.columns = mi_ordered.copy()
         return self.df
-
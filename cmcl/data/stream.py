@@ -0,0 +1,86 @@
+"""
+featurize database tables that do not fit in memory
+
+rows are read from sqlite in chunks and each chunk's composition table
+is written out as one part file before the next chunk is read.
+"""
+import os
+import glob
+import pandas as pd
+
+from cmcl.db.access import get_engine
+from cmcl.features._extract_constituents import CompositionTable
+
+def stream_comp(tblname, path, dbpath=None, chunksize=50000,
+                formula_col="Formula", index_col="index", fmt="parquet"):
+    """
+    compute the composition table of a database table chunk by chunk
+    and write it to a directory of columnar part files.
+
+    columns are grown as new constituents are seen, in order of first
+    appearance. every part carries all columns seen so far, so the
+    column order of any part is a prefix of the final order. missing
+    constituents are 0 and symbolic amounts are nan.
+
+    only index_col and formula_col are read from the table. both are
+    kept as leading columns of the output so features can be joined
+    back to their records.
+
+    fmt is "parquet" or "feather". part files left in path by an
+    earlier run are removed first. returns the final constituent
+    columns.
+
+    example:
+    stream_comp("mannodi_agg", "./mannodi_comp")
+    comp = read_comp("./mannodi_comp")
+    """
+    if fmt not in ("parquet", "feather"):
+        raise ValueError(f"fmt must be 'parquet' or 'feather', not {fmt!r}")
+    os.makedirs(path, exist_ok=True)
+    # stale parts of a longer earlier run would be read back with these
+    for stale in glob.glob(os.path.join(path, "part-*.parquet")) + \
+                 glob.glob(os.path.join(path, "part-*.feather")):
+        os.remove(stale)
+    sql_string = f'''SELECT "{index_col}", "{formula_col}"
+                     FROM "{tblname}"'''
+    engine = get_engine(dbpath)
+    columns, colindex = [], {}
+    with engine.connect() as conn:
+        chunks = pd.read_sql(sql_string, conn, index_col=index_col,
+                             chunksize=chunksize)
+        for i, chunk in enumerate(chunks):
+            table = CompositionTable(chunk)
+            codes, compdicts = table.parse()
+            for compdict in compdicts:
+                for sym in compdict:
+                    if sym not in colindex:
+                        colindex[sym] = len(columns)
+                        columns.append(sym)
+            mat = table.matrix(columns=columns, parsed=(codes, compdicts))
+            part = pd.DataFrame(mat, columns=columns, index=chunk.index)
+            part.insert(0, formula_col, chunk[formula_col])
+            part = part.reset_index()
+            partpath = os.path.join(path, f"part-{i:05d}.{fmt}")
+            if fmt == "parquet":
+                part.to_parquet(partpath, index=False)
+            else:
+                part.to_feather(partpath)
+    return columns
+
+def read_comp(path, fmt="parquet"):
+    """
+    read a directory written by stream_comp back as one table with the
+    full set of columns
+    """
+    partpaths = sorted(glob.glob(os.path.join(path, f"part-*.{fmt}")))
+    if fmt == "parquet":
+        parts = [pd.read_parquet(partpath) for partpath in partpaths]
+    else:
+        parts = [pd.read_feather(partpath) for partpath in partpaths]
+    if not parts:
+        return pd.DataFrame()
+    # union of every part's columns in order of first appearance. parts
+    # only lack constituents they do not contain
+    columns = list(dict.fromkeys(col for part in parts for col in part.columns))
+    parts = [part.reindex(columns=columns, fill_value=0) for part in parts]
+    return pd.concat(parts, ignore_index=True)
@@ -1,5 +1,6 @@
 """Much credit to Immentel's Mendeleev library"""
 import os
+from functools import lru_cache
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -9,11 +10,18 @@ def get_cmcl_perovs_path():
     """Return the Mannodi Group Perovskites database path"""
     return os.path.join(os.path.abspath(os.path.dirname(__file__)), perovsdb)
 
-def get_engine(dbpath=None):
-    """Return the db engine -- chooses perovskites database by default"""
+@lru_cache(maxsize=None)
+def _engine(dbpath, echo):
+    return create_engine(f"sqlite:///{dbpath}", echo=echo)
+
+def get_engine(dbpath=None, echo=False):
+    """
+    Return the db engine -- chooses perovskites database by default.
+    one pooled engine is kept per database path, set echo to log its SQL
+    """
     if not dbpath:
         dbpath = get_cmcl_perovs_path()
-    return create_engine(f"sqlite:///{str(dbpath)}", echo=True)
+    return _engine(os.path.abspath(os.path.expanduser(str(dbpath))), echo)
 
 def get_session(dbpath=None):
     """
@@ -1,4 +1,16 @@
-from .categories import Categories
-from ._generate_constituents import make_possible_compositions
+from cmcl._lazy import lazy
 
-__all__ = ["Categories", "make_possible_compositions"]
+__all__ = ["Categories",
+           "make_possible_compositions",
+           "iter_possible_compositions",
+           "count_possible_compositions",
+           "SiteCompositions",
+           "harvest_outcars"]
+
+__getattr__, __dir__ = lazy(__name__, [],
+                            {"Categories": ".categories",
+                             "make_possible_compositions": "._generate_constituents",
+                             "iter_possible_compositions": "._generate_constituents",
+                             "count_possible_compositions": "._generate_constituents",
+                             "SiteCompositions": "._generate_constituents",
+                             "harvest_outcars": "._extract_outcar"})
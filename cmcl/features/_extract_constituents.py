@@ -1,12 +1,12 @@
-import logging
-logfmt = '[%(levelname)s] %(asctime)s - %(message)s'
-logging.basicConfig(level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S", format=logfmt)
-
 import pandas as pd
 import re
 import numpy as np
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from unidecode import unidecode
 
+from cmcl.profiling import stage
+
 ptable ="""H                                                                   He 
            Li  Be                                          B   C   N   O   F   Ne 
            Na  Mg                                          Al  Si  P   S   Cl  Ar 
@@ -26,137 +26,297 @@ valid_nums = r"([1-9]-[xyz])|([xyz])|(\d*\.?\d+)|(\d*)"
 # reorder the ptable so short syms come last
 orelsyms = '|'.join(sorted(ptable.split(), key=len)[::-1])
 orsyms = molecules + "|" +  orelsyms
+# fixed column order for composition arrays
+vocabulary = molecules.split("|") + ptable.split()
+vocab_index = {sym: i for i, sym in enumerate(vocabulary)}
 
-num_seg = re.compile(f"({valid_nums})")
-formula_el = re.compile(f"({orsyms})")
 formula_seg = re.compile(f"({orsyms})({valid_nums})")
 formula_seq = re.compile(f"(({orsyms})({valid_nums}))+")
+# one token per constituent, opening or closing paren. closing parens
+# carry the multiplier of the group they close
+formula_tok = re.compile(f"(?:(?P<el>{orsyms})|(?P<rp>\\)))(?P<num>{valid_nums})|(?P<lp>\\()")
+
+class SymbolicAmount():
+    """
+    stoichiometric amount in terms of the symbols x, y, z
+
+    stored as a polynomial. terms maps monomials -- sorted tuples of
+    symbols, () for the constant -- to coefficients. amounts written
+    in a formula are linear, a constant plus a coefficient per symbol,
+    but symbolic group multipliers can produce products of symbols.
+
+    supports + and * with numbers and other amounts. sums in which
+    every symbol cancels reduce to a plain number.
+
+    call with symbol values, scalar or array, to evaluate:
+    SymbolicAmount.parse("1-x")(x=np.linspace(0, 1, 11))
+    """
+    __slots__ = ("terms",)
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    @classmethod
+    def parse(cls, token):
+        """make an amount from a symbolic valid_num token, ie x or 1-x"""
+        if len(token) == 1:
+            return cls({(token,): 1})
+        return cls({(): int(token[0]), (token[-1],): -1})
+
+    @staticmethod
+    def label(monomial):
+        """column label of a monomial"""
+        return "*".join(monomial) or "1"
+
+    def __add__(self, other):
+        terms = dict(self.terms)
+        if isinstance(other, SymbolicAmount):
+            for monomial, coef in other.terms.items():
+                terms[monomial] = terms.get(monomial, 0) + coef
+        else:
+            terms[()] = terms.get((), 0) + other
+        terms = {monomial: coef for monomial, coef in terms.items()
+                 if coef or not monomial}
+        if list(terms) == [()]:
+            return terms[()]
+        return SymbolicAmount(terms)
+
+    __radd__ = __add__
+
+    def __mul__(self, other):
+        if not isinstance(other, SymbolicAmount):
+            return SymbolicAmount({monomial: coef * other
+                                   for monomial, coef in self.terms.items()})
+        terms = {}
+        for m1, c1 in self.terms.items():
+            for m2, c2 in other.terms.items():
+                monomial = tuple(sorted(m1 + m2))
+                terms[monomial] = terms.get(monomial, 0) + c1 * c2
+        return SymbolicAmount(terms)
+
+    __rmul__ = __mul__
+
+    def __call__(self, **values):
+        total = 0
+        for monomial, coef in self.terms.items():
+            for sym in monomial:
+                coef = coef * values[sym]
+            total = total + coef
+        return total
+
+    def __eq__(self, other):
+        return isinstance(other, SymbolicAmount) and self.terms == other.terms
+
+    def __hash__(self):
+        return hash(frozenset(self.terms.items()))
+
+    def __repr__(self):
+        return "+".join(f"{coef}{'*' if monomial else ''}{self.label(monomial) if monomial else ''}"
+                        for monomial, coef in self.terms.items()).replace("+-", "-")
+
+def parse_num(token):
+    """convert a valid_num token to int, float, or a SymbolicAmount"""
+    if not token:
+        return 1
+    if token[-1] in "xyz":
+        return SymbolicAmount.parse(token)
+    if "." in token:
+        return float(token)
+    return int(token)
 
-class FormulaParser():
+def process_formula(entry):
     """
-    Converts a variety of chemical formula conventions into a useful datastructure
+    Converts a variety of chemical formula conventions into a dictionary
+    of constituent amounts. apply to formula series to obtain series of
+    dicts for construction. amounts are numbers or, when the formula
+    uses x, y or z, SymbolicAmounts
 
     Accepted Grammar:
     formula = (formula_element valid_num)+
     formula_element = element | lparen formula rparen
     valid_num = REAL | symbolic
 
-    each method is applied in sequence, progressively mutating the index
-    """
-    def __init__(self, alloy):
-        self.alloy = alloy
-        self.index = 0
-        self.lparen = re.compile(r"\(")
-        self.rparen = re.compile(r"\)")
+    the formula is tokenized in a single pass. Parenthesized groups
+    are tracked on a stack and their multipliers are applied once the
+    whole formula is read, so no intermediate tree is built.
 
-    def parse_lparen(self):
-        if self.lparen.match(self.alloy, self.index):
-            self.index += 1
-            return True
-        else:
-            return None
-
-    def parse_rparen(self):
-        if self.rparen.match(self.alloy, self.index):
-            self.index += 1
-
-    def parse_num(self):
-        match = num_seg.match(self.alloy, self.index)
-        if match:
-            self.index = match.end()
-            number = self.alloy[match.span()[0]:match.span()[1]]
-            return pd.to_numeric(number or 1, errors="ignore")
-
-    def parse_new_formula(self):
-        result = []
-        e = self.parse_formula_element()
-        while e:
-            num = self.parse_num()
-            result.append((e, num))
-            e = self.parse_formula_element()
-        return result
-
-    def parse_formula_element(self):
-        e = self.parse_element()
-
-        if e:
-            return e
-        else:
-            if self.parse_lparen():
-                f = self.parse_new_formula()
-                self.parse_rparen()
-                return f
-            else:
-                return None
-
-    def parse_element(self):
-        match = formula_el.match(self.alloy, self.index)
-
-        if match:
-            self.index = match.end()
-            e = self.alloy[match.span()[0]:match.span()[1]]
-            return e
+    parsing stops at the first token that does not fit the grammar
+    """
+    leaves = [] # (symbol, amount, group)
+    parents = [0] # parent of each group, group 0 is the whole formula
+    nums = [1] # multiplier of each group
+    stack = [0]
+    pos = 0
+    for match in formula_tok.finditer(entry):
+        if match.start() != pos:
+            break
+        pos = match.end()
+        el, rp, num, lp = match.group("el", "rp", "num", "lp")
+        if el:
+            leaves.append((el, parse_num(num), stack[-1]))
+        elif lp:
+            parents.append(stack[-1])
+            nums.append(1)
+            stack.append(len(nums) - 1)
         else:
-            return None
-
-def total_shorten(composition_tree):
-    """calls helper to dynamically adapt mapping function"""
-    top_func = lambda ftuple: total_shorten_helper(ftuple, 1)
-    return list(map(top_func, composition_tree))
-
-
-def total_shorten_helper(ftuple, multiplier):
-    """Takes a tuple and a multipler. Returns the subformula of the tuple multipled"""
-    subformula = ftuple[0]
-    if isinstance(ftuple[1], (float, int, np.float64, np.int64)) and isinstance(multiplier, (float, int, np.float64, np.int64)):
-        num = ftuple[1] * multiplier
-    else:
-        num = "(" + str(multiplier) + ")" + "(" + str(ftuple[1]) + ")"
-
-    if isinstance(subformula, list):
-        current_func = lambda ftuple: total_shorten_helper(ftuple, num)
-
-        new_subformula = list(map(current_func, subformula))
-        return new_subformula
-    else:
-        return (subformula, num)
-
-def flatten_list(list_of_lists, flat_list=None):
-    """generally flatten lists recursively"""
-    if not type(flat_list) == list:
-        flat_list = []
-    for item in list_of_lists:
-        if type(item) == list:
-            flatten_list(item, flat_list)
+            group = stack[-1]
+            # unmatched rparen or empty group
+            if not group or not leaves or leaves[-1][2] < group:
+                break
+            nums[stack.pop()] = parse_num(num)
+    # groups are numbered in order of appearance, so parents come first
+    multipliers = [1] * len(nums)
+    for group in range(1, len(nums)):
+        multipliers[group] = nums[group] * multipliers[parents[group]]
+    formula_dict = {}
+    for el, num, group in leaves:
+        num = num * multipliers[group]
+        if el in formula_dict:
+            formula_dict[el] = formula_dict[el] + num
         else:
-            flat_list.append(item)
-    return flat_list
+            formula_dict[el] = num
+    return formula_dict
+
+# process-wide memo of parsed formula shared by every CompositionTable.
+# results are shared between callers and must not be mutated.
+# hit/miss stats: parse_formula.cache_info()
+formula_cache_size = 2**16
+parse_formula = lru_cache(maxsize=formula_cache_size)(process_formula)
+
+# a run of tokens, checked against the whole formula by validate_formulas.
+# each token is captured in a lookahead and then consumed, which keeps the
+# regex from backtracking into splits the parser never makes, ie FAs as F As
+formula_toks = re.compile(f"(?:(?=({formula_tok.pattern}))\\1)+")
+
+def normalize_formulas(entries):
+    """
+    strip subscript markup and transliterate formula strings to ascii.
+    most formula are ascii already, only the others go through unidecode.
+    entries that are not strings become nan
+    """
+    entries = pd.Series(entries, dtype=object)
+    # normalize string encoding!
+    entries = entries.str.replace(r"[_{}]", "", regex=True)
+    other = np.fromiter((isinstance(entry, str) and not entry.isascii() for entry in entries),
+                        dtype=bool, count=len(entries))
+    if other.any():
+        entries[other] = entries[other].map(unidecode)
+    return entries
 
-def compile_nums(flatlist):
+def validate_formulas(entries):
     """
-    create dictionary by combining key values for repeated keys.
-    provides symbolic concatenation for unlike dtypes
+    mask of normalized formula strings accepted whole by the grammar of
+    process_formula: one unbroken run of tokens, parens balanced, no
+    empty groups. vectorized over the series, no formula is parsed
     """
-    collect_dict = {}
-    for eltuple in flatlist:
-        if eltuple[0] not in collect_dict.keys():
-            collect_dict[eltuple[0]] = eltuple[1]
+    entries = pd.Series(entries, dtype=object)
+    valid = entries.str.fullmatch(formula_toks).fillna(False).to_numpy(dtype=bool)
+    if not valid.any():
+        return valid
+    # only formula with parens need checking further
+    grouped = valid.copy()
+    grouped[valid] = entries[valid].str.contains(r"[()]").to_numpy(dtype=bool)
+    parens = entries[grouped].str.replace(r"[^()]+", "", regex=True)
+    # an empty group is always a literal (), other groups hold an element
+    valid[grouped] = ~entries[grouped].str.contains("()", regex=False).to_numpy(dtype=bool)
+    # strip innermost pairs, as many rounds as the deepest nesting
+    while (parens.str.len() > 0).any():
+        stripped = parens.str.replace("()", "", regex=False)
+        if stripped.equals(parens):
+            break
+        parens = stripped
+    valid[grouped] &= (parens.str.len() == 0).to_numpy(dtype=bool)
+    return valid
+
+def formula_error(entry):
+    """
+    offset of the first character of a normalized formula string the
+    grammar does not accept and the reason, or None when it is valid
+    """
+    if not isinstance(entry, str):
+        return 0, "not a string"
+    if not entry:
+        return 0, "empty formula"
+    opened = [] # offset of each open paren and the constituents before it
+    count = 0
+    pos = 0
+    for match in formula_tok.finditer(entry):
+        if match.start() != pos:
+            break
+        if match.group("lp"):
+            opened.append((pos, count))
+        elif match.group("rp"):
+            if not opened:
+                return pos, "unmatched )"
+            if opened.pop()[1] == count:
+                return pos, "empty group"
         else:
-            if type(collect_dict[eltuple[0]]) != type(eltuple[1]):
-                collect_dict[eltuple[0]] = str(collect_dict[eltuple[0]]) + "+" + str(eltuple[1])
-            elif isinstance(collect_dict[eltuple[0]], str):
-                collect_dict[eltuple[0]] = collect_dict[eltuple[0]] + "+" + str(eltuple[1])
-            else:
-                collect_dict[eltuple[0]] += eltuple[1]
-    return collect_dict
+            count += 1
+        pos = match.end()
+    if pos != len(entry):
+        return pos, "unexpected character"
+    if opened:
+        return opened[-1][0], "unclosed ("
+    return None
 
-def process_formula(entry):
-    """apply to formula series to obtain series of dicts for construction"""
-    composition_tree = FormulaParser(entry).parse_new_formula()
-    shorter_tree = total_shorten(composition_tree)
-    formula_zip = flatten_list(shorter_tree)
-    formula_dict = compile_nums(formula_zip)
-    return formula_dict
+def formula_errors(entries, normalized, valid):
+    """
+    report of the entries rejected by validate_formulas: the original
+    entry, its normalized form, the offset of the first character not
+    accepted in the normalized form, that character and the reason.
+    indexed like entries
+    """
+    entries = pd.Series(entries, dtype=object)
+    rejected = normalized[~np.asarray(valid)]
+    errors = [formula_error(entry) or (None, None) for entry in rejected]
+    offsets = [offset for offset, _ in errors]
+    chars = [entry[offset:offset+1] if isinstance(entry, str) else None
+             for entry, offset in zip(rejected, offsets)]
+    return pd.DataFrame({"Formula": entries[rejected.index].to_numpy(),
+                         "normalized": rejected.to_numpy(),
+                         "offset": pd.array(offsets, dtype="Int64"),
+                         "char": chars,
+                         "reason": [reason for _, reason in errors]},
+                        index=rejected.index)
+
+def parse_formulas(entries):
+    """
+    normalize, validate and parse a sequence of formula strings.
+    formula rejected by validate_formulas are not parsed and get empty
+    compositions. module level so it can be shipped to executor workers
+    """
+    with stage("comp.normalize", rows=len(entries)):
+        entries = normalize_formulas(entries)
+    with stage("comp.validate", rows=len(entries)):
+        valid = validate_formulas(entries)
+    with stage("comp.parse", rows=int(valid.sum())) as s:
+        before = parse_formula.cache_info()
+        compdicts = [parse_formula(entry) if ok else {} for entry, ok in zip(entries, valid)]
+        after = parse_formula.cache_info()
+        s.count(hits=after.hits-before.hits, misses=after.misses-before.misses)
+    return compdicts
+
+def composition_keys(mat, tolerance=1e-4):
+    """
+    canonical keys of rows of constituent amounts in a fixed column
+    order, ie from CompositionTable.matrix().
+
+    each row is scaled to fractions summing to 1, rounded to multiples
+    of tolerance and hashed, so one composition gets one key however
+    it is written and at any supercell multiple: CsPbI3, Cs(PbI3),
+    Cs0.5Cs0.5PbI3 and Cs2Pb2I6 share a key. fractions lying within
+    float error of a rounding boundary can still land on either side.
+
+    returns a UInt64 array, NA for rows with nan (symbolic) amounts or
+    no amounts at all
+    """
+    mat = np.asarray(mat, dtype=np.float64)
+    total = mat.sum(axis=1)
+    keyed = np.isfinite(total) & (total > 0)
+    steps = np.rint(mat[keyed] / total[keyed, np.newaxis] / tolerance).astype(np.int64)
+    keys = np.zeros(len(mat), dtype=np.uint64)
+    keys[keyed] = pd.util.hash_pandas_object(pd.DataFrame(steps), index=False).to_numpy()
+    return pd.arrays.IntegerArray(keys, ~keyed)
 
 class CompositionTable():
     """
@@ -164,15 +324,27 @@ class CompositionTable():
     of formulas' constituent quantities
 
     Create Dataframe of Compositions and pass to FeatureAccessor for future reference.
+
+    each distinct formula is parsed once per table, and parses are
+    memoized across tables by parse_formula
+
+    distinct formula can be parsed in parallel by passing any
+    concurrent.futures.Executor and/or a chunksize. Passing only a
+    chunksize parses on a temporary process pool. Chunks are
+    reassembled in order, so results do not depend on the executor.
     """
-    def __init__(self, df):
+    default_chunksize = 4096
+
+    def __init__(self, df, executor=None, chunksize=None):
         self.compdf = pd.DataFrame(df, columns=[])
+        self.executor = executor
+        self.chunksize = chunksize
         self._validate(df)
 
     def _validate(self, df):
         """
-        make sure Formula "column" exists and (wishlist) Formula strings are of
-        the expected form
+        make sure Formula "column" exists. Formula strings are checked
+        against the grammar when parsed, see validate()
         """
         if "Formula" in df or "formula" in df:
             try:
@@ -187,20 +359,210 @@ class CompositionTable():
         else:
             raise AttributeError("No 'Formula' column label or Index level recognized.")
 
-    def make(self):
-        # normalize string encoding!
-        self.Formula = self.Formula.str.replace("[\_\{\}]", "", regex=True)
-        self.Formula = self.Formula.apply(lambda entry: "".join(list(map(unidecode, entry))))
-        compdict_s = self.Formula.apply(process_formula)
-        compdf = pd.DataFrame(compdict_s.to_list())
-        comp_s_dict = compdf.to_dict()
-        comp_dict = {}
-        for k,v in comp_s_dict.items():
-            comp_dict[k] = list(v.values())
-        return comp_dict
+    def validate(self):
+        """
+        check every distinct formula against the grammar without parsing.
+
+        returns a boolean mask of rows whose formula is accepted and a
+        report of the rejected rows, see formula_errors, indexed by the
+        rows' labels. rejected rows are left empty by make() and matrix().
+        missing formula are rejected but not reported
+        """
+        with stage("comp.factorize", rows=len(self.Formula)):
+            codes, uniques = pd.factorize(self.Formula)
+        with stage("comp.validate", rows=len(uniques)):
+            normalized = normalize_formulas(uniques)
+            uvalid = validate_formulas(normalized)
+            report = formula_errors(uniques, normalized, uvalid)
+        mask = np.zeros(len(codes), dtype=bool)
+        present = codes >= 0
+        mask[present] = uvalid[codes[present]]
+        rows = np.flatnonzero(~mask & present)
+        report = report.reindex(codes[rows])
+        report.index = self.compdf.index.take(rows)
+        return mask, report
+
+    def parse(self):
+        """
+        parse each distinct formula once. formula rejected by the
+        grammar are not parsed, see validate()
+
+        returns the code of every row's formula and the list of
+        composition dicts the codes refer to
+        """
+        with stage("comp.factorize", rows=len(self.Formula)):
+            codes, uniques = pd.factorize(self.Formula)
+        if self.executor is None and self.chunksize is None:
+            compdicts = parse_formulas(uniques)
+        else:
+            chunksize = self.chunksize or self.default_chunksize
+            chunks = [uniques[i:i+chunksize] for i in range(0, len(uniques), chunksize)]
+            # workers in other processes record nothing, this stage covers them
+            with stage("comp.parse_chunks", rows=len(uniques)):
+                if self.executor is None:
+                    with ProcessPoolExecutor() as executor:
+                        parts = list(executor.map(parse_formulas, chunks))
+                else:
+                    parts = list(self.executor.map(parse_formulas, chunks))
+            compdicts = [compdict for part in parts for compdict in part]
+        # missing formula are coded -1, which would take the last
+        # distinct formula's composition. point them at an empty one
+        missing = codes < 0
+        if missing.any():
+            codes[missing] = len(compdicts)
+            compdicts.append({})
+        return codes, compdicts
+
+    def make(self, parsed=None):
+        """
+        broadcast parsed compositions back to every row by code.
+        symbolic amounts are left nan, see symbolic()
+        """
+        codes, compdicts = parsed or self.parse()
+        with stage("comp.frame", rows=len(codes)):
+            compdicts = [{sym: np.nan if isinstance(num, SymbolicAmount) else num
+                          for sym, num in compdict.items()}
+                         for compdict in compdicts]
+            compdf = pd.DataFrame(compdicts).take(codes)
+            compdf.index = self.compdf.index
+        return compdf
+
+    def matrix(self, sparse=False, columns=None, dtype=np.float64, parsed=None):
+        """
+        fill an array of constituent amounts directly, without building
+        intermediate tables.
+
+        columns default to the fixed vocabulary of molecules and
+        elements, so arrays made from different tables line up. pass
+        columns to choose another order or subset, constituents outside
+        of it are dropped. missing constituents are 0, symbolic amounts
+        are nan.
+
+        pass the (codes, compdicts) of an earlier parse() as parsed to
+        avoid parsing again.
+
+        returns a dense ndarray or, with sparse=True, a scipy CSR matrix
+        """
+        if columns is None:
+            columns, colindex = vocabulary, vocab_index
+        else:
+            colindex = {sym: i for i, sym in enumerate(columns)}
+        codes, compdicts = parsed or self.parse()
+        with stage("comp.matrix", rows=len(codes)):
+            rows, cols, vals = [], [], []
+            for row, compdict in enumerate(compdicts):
+                for sym, num in compdict.items():
+                    col = colindex.get(sym)
+                    if col is not None:
+                        rows.append(row)
+                        cols.append(col)
+                        vals.append(np.nan if isinstance(num, SymbolicAmount) else num)
+            shape = (len(compdicts), len(columns))
+            if sparse:
+                from scipy.sparse import csr_matrix
+                umat = csr_matrix((vals, (rows, cols)), shape=shape, dtype=dtype)
+                return umat[codes]
+            umat = np.zeros(shape, dtype=dtype)
+            umat[rows, cols] = vals
+            mat = np.empty((len(codes), len(columns)), dtype=dtype)
+            return np.take(umat, codes, axis=0, out=mat)
+
+    def _symbolic_entries(self, parsed):
+        """
+        row position, constituent and polynomial coefficients of every
+        symbolic amount in the table
+        """
+        codes, compdicts = parsed
+        ucodes, syms, amounts = [], [], []
+        for code, compdict in enumerate(compdicts):
+            for sym, num in compdict.items():
+                if isinstance(num, SymbolicAmount):
+                    ucodes.append(code)
+                    syms.append(sym)
+                    amounts.append(num)
+        monomials = sorted({monomial for amount in amounts for monomial in amount.terms},
+                           key=lambda monomial: (len(monomial), monomial))
+        coefs = np.array([[amount.terms.get(monomial, 0) for monomial in monomials]
+                          for amount in amounts], dtype=np.float64)
+        coefs = coefs.reshape(len(amounts), len(monomials))
+        # broadcast entries of distinct formula back to every row
+        rows = pd.DataFrame({"code": codes, "pos": np.arange(len(codes))})
+        entries = pd.DataFrame({"code": ucodes, "entry": np.arange(len(ucodes))})
+        merged = rows.merge(entries, on="code").sort_values(["pos", "entry"])
+        entry = merged["entry"].to_numpy(dtype=np.intp)
+        pos = merged["pos"].to_numpy(dtype=np.intp)
+        return pos, np.array(syms, dtype=object)[entry], coefs[entry], monomials
+
+    def symbolic(self, parsed=None):
+        """
+        side table of symbolic amounts.
+
+        one row per record and constituent with a symbolic amount,
+        indexed by the record's label and the constituent. columns are
+        coefficients of the amount's terms: "1" for the constant, then
+        one per symbol, ie 1-x is 1.0 under "1" and -1.0 under "x"
+        """
+        parsed = parsed or self.parse()
+        with stage("comp.symbolic", rows=len(parsed[0])):
+            pos, syms, coefs, monomials = self._symbolic_entries(parsed)
+            index = self.compdf.index.take(pos)
+            arrays = [index.get_level_values(i) for i in range(index.nlevels)] + [syms]
+            index = pd.MultiIndex.from_arrays(arrays, names=[*index.names, "constituent"])
+            columns = [SymbolicAmount.label(monomial) for monomial in monomials]
+            return pd.DataFrame(coefs, index=index, columns=columns)
+
+    def expand(self, parsed=None, **values):
+        """
+        evaluate every record with symbolic amounts at every point of a
+        grid of symbol values in one vectorized pass.
+
+        pass arrays of values per symbol, ie x=np.linspace(0, 1, 11).
+        arrays are broadcast against each other, so pass flattened
+        meshgrids to cross several symbols.
+
+        returns a composition table with one row per symbolic record
+        and grid point, indexed by the record's label and the symbol
+        values
+        """
+        parsed = parsed or self.parse()
+        compdf = self.make(parsed)
+        with stage("comp.expand", rows=len(parsed[0])):
+            pos, syms, coefs, monomials = self._symbolic_entries(parsed)
+            arrays = [np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in values.values()]
+            grid = dict(zip(values, np.broadcast_arrays(*arrays)))
+            npoints = len(next(iter(grid.values()))) if grid else 1
+            # value of every monomial at every grid point
+            monovals = np.ones((len(monomials), npoints))
+            for i, monomial in enumerate(monomials):
+                for sym in monomial:
+                    if sym not in grid:
+                        raise ValueError(f"no values given for symbol {sym}")
+                    monovals[i] *= grid[sym]
+            amounts = coefs @ monovals
+            records, entry_record = np.unique(pos, return_inverse=True)
+            cols = compdf.columns.get_indexer(syms)
+            mat = compdf.to_numpy(dtype=np.float64)[records]
+            mat = np.repeat(mat[:, np.newaxis, :], npoints, axis=1)
+            mat[entry_record, :, cols] = amounts
+            index = compdf.index.take(records)
+            arrays = [index.get_level_values(i).repeat(npoints) for i in range(index.nlevels)]
+            arrays += [np.tile(points, len(records)) for points in grid.values()]
+            index = pd.MultiIndex.from_arrays(arrays, names=[*index.names, *grid])
+            return pd.DataFrame(mat.reshape(-1, len(compdf.columns)), index=index,
+                                columns=compdf.columns)
+
+    def keys(self, tolerance=1e-4, parsed=None):
+        """
+        canonical composition key of every row, see composition_keys.
+        keys are computed once per distinct formula over the fixed
+        vocabulary, so keys of different tables can be compared
+        """
+        codes, compdicts = parsed or self.parse()
+        with stage("comp.keys", rows=len(codes)):
+            umat = self.matrix(parsed=(np.arange(len(compdicts)), compdicts))
+            keys = composition_keys(umat, tolerance).take(codes)
+            return pd.Series(keys, index=self.compdf.index, name="composition_key")
 
     def get(self):
-        comp_dict = self.make()
-        self.compdf = self.compdf.assign(**comp_dict)
-        #comp_cols = self.get()
+        self.compdf = self.make()
         return self.compdf
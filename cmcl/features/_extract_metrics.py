@@ -1,45 +1,159 @@
 import pandas as pd
 import numpy as np
+from functools import lru_cache
+
+from cmcl.profiling import stage
+from cmcl.features._files import find_files, executor_or_threads
 
-from mendeleev import element
 ######################
 #Jiaqi's Cubicity Calculator works directly with CONTCARS
-from ase.io import read
+structure_names = ("CONTCAR", "POSCAR")
+
+def find_structures(structures):
+    """
+    list VASP structure files. structures is a directory, searched
+    recursively for CONTCAR, POSCAR and *.vasp files, a glob pattern,
+    or a list of paths
+    """
+    return find_files(structures, lambda f: f in structure_names or f.endswith(".vasp"))
+
+def read_cell(path, out):
+    """
+    read the lattice of a POSCAR/CONTCAR into out, a 3x3 array, from
+    the header lines alone. atomic positions are never read.
+
+    returns the formula from the species and counts lines, or None
+    when the file has no species line (VASP 4)
+    """
+    with open(path) as f:
+        f.readline() # comment
+        scale = f.readline().split()
+        for i in range(3):
+            out[i] = f.readline().split()[:3]
+        species = f.readline().split()
+        counts = f.readline().split() if species[:1] and species[0][:1].isalpha() else None
+    try:
+        # VASP 6 allows one factor per cartesian direction
+        factors = np.array(scale[:3], dtype=np.float64)
+    except ValueError:
+        factors = np.array(scale[:1], dtype=np.float64)
+    if len(factors) == 3:
+        out *= factors
+    elif factors[0] < 0:
+        # negative scale is the cell volume
+        out *= (-factors[0]/abs(np.linalg.det(out)))**(1/3)
+    else:
+        out *= factors[0]
+    if counts is None:
+        return None
+    species = [sym.split("_")[0].split("/")[0] for sym in species]
+    return "".join(sym + (n if n != "1" else "") for sym, n in zip(species, counts))
+
+def read_cells(paths):
+    """
+    stack of the lattices of many VASP structure files, read into one
+    preallocated array, and their formula
+    """
+    cells = np.empty((len(paths), 3, 3), dtype=np.float64)
+    formulas = [read_cell(path, cells[i]) for i, path in enumerate(paths)]
+    return cells, formulas
+
+def cell_parameters(cells):
+    """
+    a, b, c, alpha, beta, gamma of a stack of 3x3 cells, all at once.
+    angles in degrees, following ase.geometry.cell_to_cellpar
+    """
+    lengths = np.linalg.norm(cells, axis=2)
+    angles = np.empty_like(lengths)
+    for i in range(3):
+        j, k = i-1, i-2
+        ll = lengths[:, j]*lengths[:, k]
+        x = np.einsum("ij,ij->i", cells[:, j], cells[:, k])/np.where(ll > 1e-16, ll, 1)
+        angles[:, i] = np.where(ll > 1e-16, np.degrees(np.arccos(np.clip(x, -1, 1))), 90.0)
+    return np.hstack([lengths, angles])
 
 class Calculator():
+    columns_out = ["a", "b", "c", "alpha", "beta", "gamma", "cub_b", "cub_c", "cub_alpha", "cub_beta", "cub_gamma"]
+
+    @staticmethod
+    def lattice(cells):
+        """lattice parameters and cubicity of a stack of cells"""
+        par = cell_parameters(np.asarray(cells, dtype=np.float64).reshape(-1, 3, 3))
+        a = par[:, [0]]
+        cub_len = np.abs(a - par[:, 1:3])/a
+        cub_ang = np.abs(par[:, 3:6] - 90)/90
+        return np.hstack([par, cub_len, cub_ang])
+
     @staticmethod
-    def cubicity():
-        # pre-define all lists and titles
-        prop_lattice = []
-        columns_out = ["a", "b", "c", "alpha", "beta", "gamma", "cub_b", "cub_c", "cub_alpha", "cub_beta", "cub_gamma"]
-
-        for i in range(550):
-            # input structure
-            input_name = './strut_CONT_550/' + str(i + 1) + ".vasp"
-            file_input = read(input_name, format='vasp')
-            lattice_test = file_input.cell.cellpar()
-        
-            # calculate cubicity of each structure
-            cub_b = (abs(lattice_test[0] - lattice_test[1])) / lattice_test[0]
-            cub_c = (abs(lattice_test[0] - lattice_test[2])) / lattice_test[0]
-            cub_alpha = (abs(lattice_test[3] - 90)) / 90
-            cub_beta = (abs(lattice_test[4] - 90)) / 90
-            cub_gamma = (abs(lattice_test[5] - 90)) / 90
-            # assemble properties needed
-            cubicity_test = np.array([cub_b, cub_c, cub_alpha, cub_beta, cub_gamma])
-            # print(cubicity_test)
-            lattice_test = np.append(lattice_test, cubicity_test)
-        
-            prop_lattice.append(lattice_test)
-        
-            # print(type(lattice_test[1]))
-        
-        # output lattice properties to excels for further process
-        df = pd.DataFrame(prop_lattice, columns=columns_out)
-        with pd.ExcelWriter("test.xlsx") as writer:
-            df.to_excel(writer)
+    def cubicity(structures, executor=None, chunksize=256, output=None):
+        """
+        lattice parameters and cubicity of every VASP structure found
+        by find_structures, indexed by path with each structure's
+        formula alongside, so it can be joined to composition tables.
+
+        only the lattice header of each file is read, without ase.
+        chunks of files are read concurrently on executor, any
+        concurrent.futures.Executor, or a thread pool by default. the
+        metrics of all structures are then computed in one pass.
+
+        optionally write the table to output as parquet
+        """
+        paths = find_structures(structures)
+        chunks = [paths[i:i+chunksize] for i in range(0, len(paths), chunksize)]
+        with executor_or_threads(executor) as executor:
+            parts = list(executor.map(read_cells, chunks))
+        cells = np.empty((len(paths), 3, 3), dtype=np.float64)
+        formulas = []
+        for i, (part, part_formulas) in enumerate(parts):
+            cells[i*chunksize:i*chunksize+len(part)] = part
+            formulas += part_formulas
+        df = pd.DataFrame(Calculator.lattice(cells), columns=Calculator.columns_out,
+                          index=pd.Index(paths, name="path"))
+        df.insert(0, "formula", formulas)
+        if output is not None:
+            df.to_parquet(output)
+        return df
 ############
 
+# molecules are described by the elements they are made of.
+# AM is not expanded, records containing it get nan descriptors
+molecule_constituents = {"FA": {"C": 1, "H": 5, "N": 2},
+                         "MA": {"C": 1, "H": 6, "N": 1}}
+
+mrg_stats = ["mean", "min", "max", "range"]
+
+@lru_cache(maxsize=None)
+def element_properties():
+    """
+    table of MRGTable properties for every element, indexed by symbol.
+    read once per process from mendeleev's bundled database
+
+    ion_rad is the mean ionic radius in six-fold coordination, or over
+    all coordinations for elements without one
+    """
+    from mendeleev.fetch import fetch_table
+    elements = fetch_table("elements").set_index("atomic_number")
+    ie = fetch_table("ionizationenergies")
+    ie = ie[ie.degree == 1].set_index("atomic_number").energy
+    radii = fetch_table("ionicradii")
+    six = radii[radii.coordination == "VI"].groupby("atomic_number").ionic_radius.mean()
+    ion_rad = six.combine_first(radii.groupby("atomic_number").ionic_radius.mean())
+    props = pd.DataFrame({"ion_rad": ion_rad,
+                          "BP": elements.boiling_point,
+                          "MP": elements.melting_point,
+                          "dens": elements.density,
+                          "at_wt": elements.atomic_weight,
+                          "EA": elements.electron_affinity,
+                          "IE": ie,
+                          "hof": elements.heat_of_formation,
+                          "hov": elements.evaporation_heat,
+                          "En": elements.en_pauling,
+                          "at_num": elements.index,
+                          "period": elements.period},
+                         index=elements.index, dtype=np.float64)
+    props.index = elements.symbol[props.index]
+    return props
+
 class MRGTable():
     """
     For every element:
@@ -67,7 +181,82 @@ class MRGTable():
 
     Legacy cmcl properties lookup will be preserved until I can insist
     on cutting the fat.
+
+    instantiate with a composition table: constituent columns holding
+    0 where a constituent is absent. The mean, min, max and range of
+    every property over each record's elements are computed for the
+    whole table at once. molecules are first expanded into elements
+    with one matrix product, means are weighted by atomic fraction
+    through another. min and max take each property's elements in
+    sorted order and pick the first one present in each record.
+
+    nan amounts (symbolic) and unknown constituents give nan
+    descriptors, as does a property mendeleev lacks for a present
+    element.
     """
     
     def __init__(self, mdf):
-        pass
+        self.mdf = mdf
+
+    def _expansion(self, columns, props):
+        """
+        matrix mapping composition columns to the elements they
+        contain, and mask of columns that can't be mapped
+        """
+        expansion = np.zeros((len(columns), len(props)))
+        unknown = np.zeros(len(columns), dtype=bool)
+        for i, col in enumerate(columns):
+            if col in molecule_constituents:
+                for el, n in molecule_constituents[col].items():
+                    expansion[i, props.index.get_loc(el)] += n
+            elif col in props.index:
+                expansion[i, props.index.get_loc(col)] = 1
+            else:
+                unknown[i] = True
+        return expansion, unknown
+
+    def make(self):
+        with stage("mrg.properties"):
+            props = element_properties()
+        comp = self.mdf.to_numpy(dtype=np.float64)
+        # only keep constituents in the table and the elements they reach
+        active = (comp != 0).any(axis=0)
+        comp = comp[:, active]
+        expansion, unknown = self._expansion(self.mdf.columns[active], props)
+        used = expansion.any(axis=0)
+        expansion, props = expansion[:, used], props[used]
+        pmat = props.to_numpy()
+        pmissing = np.isnan(pmat)
+
+        amounts = comp @ expansion
+        present = np.nan_to_num(amounts) > 0
+        invalid = np.isnan(amounts).any(axis=1) | (comp[:, unknown] != 0).any(axis=1)
+        invalid |= ~present.any(axis=1)
+        stats = {}
+        # empty and nan rows divide by zero or nan, they are masked below
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fractions = amounts / amounts.sum(axis=1, keepdims=True)
+            stats["mean"] = fractions @ np.nan_to_num(pmat)
+        # a present element without the property spoils the statistic
+        lacking = (present.astype(np.float64) @ pmissing) > 0
+        for stat, ascending in (("min", True), ("max", False)):
+            values = np.full((len(comp), len(props.columns)), np.nan)
+            for j in range(len(props.columns) if len(props) else 0):
+                # nan properties are sorted last either way
+                order = np.argsort(pmat[:, j] if ascending else -pmat[:, j], kind="stable")
+                first = present[:, order].argmax(axis=1)
+                values[:, j] = pmat[order[first], j]
+            stats[stat] = values
+        stats["range"] = stats["max"] - stats["min"]
+
+        columns, blocks = [], []
+        for stat in mrg_stats:
+            block = stats[stat]
+            block[invalid[:, np.newaxis] | lacking] = np.nan
+            blocks.append(block)
+            columns += [f"{prop}_{stat}" for prop in props.columns]
+        return pd.DataFrame(np.hstack(blocks), index=self.mdf.index, columns=columns)
+
+    def get(self):
+        with stage("mrg.make", rows=len(self.mdf)):
+            return self.make()
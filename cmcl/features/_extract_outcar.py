@@ -0,0 +1,116 @@
+import os
+import mmap
+import numpy as np
+import pandas as pd
+
+from cmcl.features._files import find_files, executor_or_threads
+
+######################
+#harvest final energies and convergence of VASP runs from their OUTCARs
+outcar_name = "OUTCAR"
+
+outcar_dtypes = {"energy": "float64",
+                 "energy_sigma0": "float64",
+                 "efermi": "float64",
+                 "band_gap": "float64",
+                 "ionic_steps": "Int64",
+                 "electronic_converged": "boolean",
+                 "relaxed": "bool",
+                 "finished": "bool"}
+
+def find_outcars(calcs):
+    """
+    list OUTCAR files. calcs is a directory, searched recursively, a
+    glob pattern, or a list of paths
+    """
+    return find_files(calcs, lambda f: f == outcar_name)
+
+def _number(buf, marker, start=0, field=0):
+    """
+    float following the last marker in buf after start, the field-th
+    whitespace separated token after it. nan if there is none
+    """
+    pos = buf.rfind(marker, start)
+    if pos < 0:
+        return np.nan
+    end = buf.find(b"\n", pos)
+    tokens = buf[pos+len(marker):end if end >= 0 else len(buf)].split()
+    try:
+        return float(tokens[field])
+    except (IndexError, ValueError):
+        return np.nan
+
+def _band_gap(buf, start):
+    """
+    gap between the highest occupied and lowest unoccupied eigenvalue
+    over all spins and k-points of the eigenvalue listing after start
+    """
+    end = buf.find(b"\n---", start)
+    occupied, empty = -np.inf, np.inf
+    for line in buf[start:end if end >= 0 else len(buf)].splitlines():
+        tokens = line.split()
+        if len(tokens) != 3 or not tokens[0].isdigit():
+            continue
+        energy, occupation = float(tokens[1]), float(tokens[2])
+        if occupation > 0.5:
+            occupied = max(occupied, energy)
+        else:
+            empty = min(empty, energy)
+    if np.isinf(occupied) or np.isinf(empty):
+        return np.nan
+    return max(empty-occupied, 0.)
+
+def read_outcar(path):
+    """
+    final energies, fermi level, band gap and convergence of one VASP
+    run.
+
+    the OUTCAR is memory mapped and searched backward from its end, so
+    only the last ionic step is ever read no matter how long the
+    relaxation was
+    """
+    row = dict.fromkeys(outcar_dtypes, np.nan)
+    row.update(relaxed=False, finished=False, electronic_converged=None)
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return row
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            # everything of interest is printed during the last ionic step
+            last = buf.rfind(b"Iteration")
+            start = max(last, 0)
+            if last >= 0:
+                step = buf[last:buf.find(b"(", last)].split()
+                row["ionic_steps"] = int(step[1]) if len(step) > 1 and step[1].isdigit() else np.nan
+            row["energy"] = _number(buf, b"free  energy   TOTEN  =", start)
+            row["energy_sigma0"] = _number(buf, b"energy(sigma->0) =", start)
+            efermi = buf.rfind(b"E-fermi :", start)
+            if efermi >= 0:
+                row["efermi"] = _number(buf, b"E-fermi :", efermi)
+                row["band_gap"] = _band_gap(buf, efermi)
+            reached = buf.rfind(b"aborting loop because EDIFF is reached", start)
+            unreached = buf.rfind(b"aborting loop EDIFF was not reached", start)
+            if reached >= 0 or unreached >= 0:
+                row["electronic_converged"] = reached > unreached
+            row["relaxed"] = buf.rfind(b"reached required accuracy", start) >= 0
+            row["finished"] = buf.rfind(b"General timing and accounting", start) >= 0
+    return row
+
+def harvest_outcars(calcs, executor=None, output=None):
+    """
+    one row per VASP run found by find_outcars, indexed by the run's
+    directory, with columns typed as in outcar_dtypes.
+
+    files are read concurrently on executor, any
+    concurrent.futures.Executor, or a thread pool by default.
+
+    optionally write the table to output as parquet
+    """
+    paths = find_outcars(calcs)
+    with executor_or_threads(executor) as executor:
+        rows = list(executor.map(read_outcar, paths))
+    index = pd.Index([os.path.dirname(path) for path in paths], name="calc")
+    df = pd.DataFrame(rows, index=index, columns=list(outcar_dtypes))
+    df = df.astype(outcar_dtypes)
+    if output is not None:
+        df.to_parquet(output)
+    return df
@@ -0,0 +1,34 @@
+"""
+finding calculation files and reading them concurrently
+"""
+import os
+import glob
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+def find_files(spec, match):
+    """
+    list files. spec is a directory, searched recursively for files
+    whose name passes match, a glob pattern, or a list of paths
+    """
+    if isinstance(spec, (list, tuple)):
+        return list(spec)
+    if os.path.isdir(spec):
+        paths = []
+        for root, dirs, files in os.walk(spec):
+            paths += [os.path.join(root, f) for f in files if match(f)]
+        return sorted(paths)
+    return sorted(glob.glob(spec, recursive=True))
+
+@contextmanager
+def executor_or_threads(executor=None):
+    """
+    executor, any concurrent.futures.Executor, or a thread pool that
+    lasts for the block when it is None. reading files is io bound, so
+    threads are the default
+    """
+    if executor is not None:
+        yield executor
+        return
+    with ThreadPoolExecutor() as pool:
+        yield pool
@@ -1,30 +1,128 @@
 """ tools for extending composition vectors systematically """
 
+import random
 import numpy as np
 import pandas as pd
-from itertools import permutations
+from math import comb, prod
+from itertools import combinations
 
-def partitions(t:int, s:int):
+def count_compositions(t:int, s:int)->int:
+    """ exact number of compositions of a total t of size s """
+    return comb(t+s-1, s-1)
+
+def iter_compositions(t:int, s:int, blocksize:int=65536):
     """
-    generate all partitions for a total t of size s
+    lazily generate all compositions for a total t of size s
 
-    partition vectors are padded with zeros as needed
+    stars and bars: each choice of s-1 bar positions among t+s-1 slots
+    is one composition. combinations emits choices in lexicographic
+    order, which is also the lexicographic order of the compositions,
+    so every composition is emitted exactly once, in order.
 
-    TODO: handle s == 1 better than with a branch, 
+    yields integer arrays of blocksize rows, the last may be shorter
     """
     if s == 1:
-        yield (t,)
-    else:
-        for i in range(0, t//2+1):
-            for p in partitions(t-i, s-1):
-                yield (i,)+p
+        yield np.array([[t]])
+        return
+    n = t+s-1
+    bars = combinations(range(n), s-1)
+    dtype = np.dtype((np.intp, (s-1,)))
+    remaining = count_compositions(t, s)
+    while remaining:
+        size = min(blocksize, remaining)
+        remaining -= size
+        padded = np.empty((size, s+1), dtype=np.intp)
+        padded[:, 0] = -1
+        padded[:, 1:-1] = np.fromiter(bars, dtype=dtype, count=size)
+        padded[:, -1] = n
+        # parts are the gaps between consecutive bars
+        yield np.diff(padded, axis=1) - 1
+
+def _binomials(n:int, k:int)->np.array:
+    """
+    table of binomial coefficients C(i, j) for i <= n, j <= k.
+    falls back to python integers when they overflow int64
+    """
+    table = [[comb(i, j) for j in range(k+1)] for i in range(n+1)]
+    if max(map(max, table)) < 2**63:
+        return np.array(table, dtype=np.int64)
+    return np.array(table, dtype=object)
+
+def rank_compositions(a:np.array, t:int)->np.array:
+    """
+    lexicographic rank of each row of a, compositions for a total t,
+    among all compositions of its size. inverse of unrank_compositions
+    """
+    a = np.asarray(a, dtype=np.intp)
+    n, s = a.shape
+    if (a < 0).any() or (a.sum(axis=1) != t).any():
+        raise ValueError(f"rows must be non-negative and sum to {t}")
+    binom = _binomials(t+s, s)
+    ranks = np.zeros(n, dtype=binom.dtype)
+    rem = np.full(n, t, dtype=np.intp)
+    for i in range(s-1):
+        # compositions sharing the prefix with a smaller part here
+        k = s-i-1
+        ranks = ranks + binom[rem+k, k] - binom[rem-a[:, i]+k, k]
+        rem -= a[:, i]
+    return ranks
+
+def unrank_compositions(ranks:np.array, t:int, s:int)->np.array:
+    """
+    compositions for a total t of size s at the given lexicographic
+    ranks, without generating the ones before them
+    """
+    binom = _binomials(t+s, s)
+    ranks = np.array(ranks, dtype=binom.dtype).reshape(-1)
+    if (ranks < 0).any() or (ranks >= count_compositions(t, s)).any():
+        raise IndexError(f"ranks must be in [0, {count_compositions(t, s)})")
+    a = np.zeros((len(ranks), s), dtype=np.intp)
+    rem = np.full(len(ranks), t, dtype=np.intp)
+    for i in range(s-1):
+        k = s-i-1
+        part = np.zeros(len(ranks), dtype=np.intp)
+        while True:
+            # compositions with this part and prefix
+            c = binom[rem-part+k-1, k-1]
+            step = ranks >= c
+            if not step.any():
+                break
+            ranks = ranks - np.where(step, c, 0)
+            part += step
+        a[:, i] = part
+        rem -= part
+    a[:, -1] = rem
+    return a
 
 def compositions(t:int,s:int)->np.array:
     """ generate all compositions for a total t of size s """
-    a = np.array(list(map(list,[permutations(tpl) for tpl in partitions(t,s)])))
-    a = np.unique(a.reshape(-1, a.shape[-1]), axis=0)
+    a = np.empty((count_compositions(t, s), s), dtype=np.intp)
+    start = 0
+    for block in iter_compositions(t, s):
+        a[start:start+len(block)] = block
+        start += len(block)
     return a
 
+def count_possible_compositions(constituents:list, unit_total:int, supercell_size:int)->int:
+    """ number of rows make_possible_compositions would return """
+    return count_compositions(unit_total*supercell_size, len(constituents))
+
+def iter_possible_compositions(constituents:list, unit_total:int, supercell_size:int, blocksize:int=65536):
+    """
+    lazily generate all possible composition vectors for a given list
+    of candidate constituents in frames of blocksize rows.
+
+    rows are in the same order as make_possible_compositions and are
+    indexed by their position in it
+    """
+    t = unit_total*supercell_size
+    l = len(constituents)
+    start = 0
+    for block in iter_compositions(t, l, blocksize):
+        index = pd.RangeIndex(start, start+len(block))
+        start += len(block)
+        yield pd.DataFrame((supercell_size**-1)*block, columns=constituents, index=index)
+
 def make_possible_compositions(constituents:list, unit_total:int, supercell_size:int):
     """ generate all possible composition vectors for a given list of candidate constituents """
     t = unit_total*supercell_size
@@ -32,3 +130,94 @@ def make_possible_compositions(constituents:list, unit_total:int, supercell_size
     a = (supercell_size**-1)*compositions(t, l)
     return pd.DataFrame(a, columns=constituents)
 
+class SiteCompositions():
+    """
+    composition space of a structure with several sites, ie the A, B
+    and X sites of a perovskite, each with its own candidate
+    constituents and total.
+
+    sites = {"A": ["MA", "FA", "Cs"], "B": ["Pb", "Sn"], "X": ["I", "Br", "Cl"]}
+    totals = {"A": 1, "B": 1, "X": 3}
+    space = SiteCompositions(sites, totals, supercell_size=4)
+
+    the space is the cartesian product of every site's compositions,
+    ordered like itertools.product over the sites in the order given,
+    with each site's compositions in lexicographic order. Every
+    composition has a rank, its position in that order. ranks and
+    compositions are computed from each other directly, so the space
+    can be split between workers (space.iter(start, stop)), sampled
+    uniformly (space.sample(n)), or resumed from any rank without
+    generating what comes before.
+
+    compositions are frames of fractional amounts like
+    make_possible_compositions, with (site, element) MultiIndex
+    columns like CollectionAccessor.abx, indexed by rank
+    """
+    def __init__(self, sites:dict, totals:dict, supercell_size:int=1):
+        self.sites = sites
+        self.supercell_size = supercell_size
+        self.totals = {site: totals[site]*supercell_size for site in sites}
+        self.counts = [count_compositions(self.totals[site], len(members))
+                       for site, members in sites.items()]
+        self.columns = pd.MultiIndex.from_tuples(
+            [(site, member) for site, members in sites.items() for member in members],
+            names=("site", "element"))
+        # len() is limited to index-sized integers, size is not
+        self.size = prod(self.counts)
+
+    def __len__(self):
+        return self.size
+
+    def _ranks(self, ranks):
+        """integer array of ranks, python integers if the space overflows int64"""
+        dtype = np.int64 if self.size < 2**63 else object
+        return np.array(ranks, dtype=dtype).reshape(-1)
+
+    def take(self, ranks)->pd.DataFrame:
+        """compositions at the given ranks"""
+        ranks = self._ranks(ranks)
+        if (ranks < 0).any() or (ranks >= self.size).any():
+            raise IndexError(f"ranks must be in [0, {self.size})")
+        index = pd.Index(ranks, name="rank")
+        # mixed radix, the last site varies fastest
+        blocks = []
+        for (site, members), count in reversed(list(zip(self.sites.items(), self.counts))):
+            ranks, site_ranks = ranks // count, ranks % count
+            blocks.append(unrank_compositions(site_ranks, self.totals[site], len(members)))
+        a = np.hstack(blocks[::-1])
+        return pd.DataFrame((self.supercell_size**-1)*a, columns=self.columns, index=index)
+
+    def rank(self, df)->np.array:
+        """ranks of the compositions in the rows of df, columns as in take"""
+        a = np.rint(np.asarray(df[self.columns], dtype=np.float64)*self.supercell_size)
+        a = a.astype(np.intp)
+        ranks = self._ranks([0]*len(a))
+        start = 0
+        for (site, members), count in zip(self.sites.items(), self.counts):
+            stop = start+len(members)
+            site_ranks = rank_compositions(a[:, start:stop], self.totals[site])
+            ranks = ranks*count + site_ranks
+            start = stop
+        return ranks
+
+    def iter(self, start:int=0, stop:int=None, blocksize:int=65536):
+        """lazily generate compositions ranked [start, stop) in frames of blocksize rows"""
+        stop = self.size if stop is None else min(stop, self.size)
+        for block_start in range(start, stop, blocksize):
+            block_stop = min(block_start+blocksize, stop)
+            yield self.take(range(block_start, block_stop))
+
+    def sample(self, n:int, random_state=None)->pd.DataFrame:
+        """n compositions drawn uniformly without replacement"""
+        rng = random.Random(random_state)
+        if self.size < 2**63:
+            ranks = rng.sample(range(self.size), n)
+        elif n > self.size:
+            raise ValueError("sample larger than the space")
+        else:
+            # too big for range(), but collisions are vanishingly rare
+            ranks = {}
+            while len(ranks) < n:
+                ranks[rng.randrange(self.size)] = None
+            ranks = list(ranks)
+        return self.take(ranks)
@@ -1,8 +1,5 @@
-import logging
-logfmt = '[%(levelname)s] %(asctime)s - %(message)s'
-logging.basicConfig(level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S", format=logfmt)
-
 from functools import partial
+import numpy as np
 import pandas as pd
 
 class Categories():
@@ -13,7 +10,7 @@ class Categories():
     Ideal for producing scatter plot labels.
     """
     @staticmethod
-    def logif(df, condition, default=None, catstring="_&_"):
+    def logif(df, condition, default=None, catstring="_&_", vectorized=False):
         """
         produce a series of categorical strings based on the numerical
         contents of a dataframe, its column names, and some condition
@@ -22,7 +19,15 @@ class Categories():
 
         example:
         df.pipe(Categories.logif, condition=lambda x: x>1, default="pure")
+
+        with vectorized=True, condition is called once on the whole
+        frame and must return a boolean mask of the same shape, as
+        comparisons like the one above do. Each row's set of matching
+        columns is packed into a bitmask and labels are only joined
+        once per distinct mask. The result is categorical.
         """
+        if vectorized:
+            return Categories._logif_mask(df, condition, default, catstring)
         def _logif(row, catstring):
             stringlist=[]
             for entry, label in zip(row, df.columns):
@@ -35,3 +40,26 @@ class Categories():
         _logif = partial(_logif, catstring=catstring)
         catseries = df.apply(_logif, axis=1)
         return catseries
+
+    @staticmethod
+    def _logif_mask(df, condition, default, catstring):
+        """vectorized logif, see logif"""
+        mask = np.asarray(condition(df), dtype=bool)
+        if mask.shape != df.shape:
+            raise ValueError(f"condition returned shape {mask.shape}, expected {df.shape}")
+        # one bit per column, rows as opaque byte strings
+        packed = np.packbits(mask, axis=1)
+        if not packed.shape[1]:
+            packed = np.zeros((len(df), 1), dtype=np.uint8)
+        keys = np.ascontiguousarray(packed).view(np.dtype((np.void, packed.shape[1]))).ravel()
+        masks, codes = np.unique(keys, return_inverse=True)
+        labels = []
+        for key in masks:
+            bits = np.unpackbits(np.frombuffer(key.tobytes(), dtype=np.uint8))
+            columns = df.columns[bits[:df.shape[1]].astype(bool)]
+            labels.append(catstring.join(map(str, columns)) or str(default))
+        # distinct masks can still share a label, ie with repeated columns
+        relabel, categories = pd.factorize(np.array(labels, dtype=object))
+        codes = relabel[codes.ravel()]
+        catseries = pd.Series(pd.Categorical.from_codes(codes, categories), index=df.index)
+        return catseries
@@ -0,0 +1,8 @@
+from cmcl._lazy import lazy
+
+__all__ = ["Predictor",
+           "PredictionServer"]
+
+__getattr__, __dir__ = lazy(__name__, [],
+                            {"Predictor": ".predictor",
+                             "PredictionServer": ".server"})
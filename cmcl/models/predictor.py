@@ -0,0 +1,97 @@
+"""
+apply persisted models to formulas in bulk
+
+a Predictor is a fitted model, anything with a predict method taking a
+2d array like a scikit-learn estimator, together with the composition
+columns it was fit on. it is saved and loaded as one pickle, so the
+columns can never drift from the model.
+
+comp = df.ft.comp().fillna(0)
+model = RandomForestRegressor().fit(comp, df.PBE_bg_eV)
+Predictor(model, comp.columns, "PBE_bg_eV").save("bg.pkl")
+
+Predictor.load("bg.pkl").predict(["CsPbI3", "MAPb(I0.5Br0.5)3"])
+
+only load model files from sources you trust, unpickling runs code.
+"""
+import pickle
+import numpy as np
+import pandas as pd
+from itertools import islice
+
+from cmcl.features._extract_constituents import CompositionTable, SymbolicAmount
+
+class Predictor():
+    """
+    fitted model and the constituent columns of its features.
+
+    formulas are featurized straight into an array in the model's
+    column order. rows the model cannot be trusted on get nan
+    predictions instead: formulas that do not parse, symbolic
+    formulas, and formulas with constituents the model never saw.
+    """
+    def __init__(self, model, columns, target="prediction"):
+        self.model = model
+        self.columns = list(columns)
+        self.target = target
+        self._colset = frozenset(self.columns)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        return cls(state["model"], state["columns"], state["target"])
+
+    def save(self, path):
+        state = {"model": self.model, "columns": self.columns, "target": self.target}
+        with open(path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @property
+    def targets(self):
+        return [self.target] if isinstance(self.target, str) else list(self.target)
+
+    def features(self, formulas):
+        """feature array of formulas in the model's columns, and the rows that are valid"""
+        table = CompositionTable(pd.DataFrame({"Formula": formulas}))
+        codes, compdicts = table.parse()
+        # validity is decided once per distinct formula
+        valid = np.array([bool(compdict) and compdict.keys() <= self._colset
+                          and not any(isinstance(num, SymbolicAmount) for num in compdict.values())
+                          for compdict in compdicts], dtype=bool)
+        X = table.matrix(columns=self.columns, parsed=(codes, compdicts))
+        return X, valid[codes] if len(codes) else np.zeros(0, dtype=bool)
+
+    def _predict(self, X, valid):
+        """predictions of the valid rows of X in one call, nan elsewhere"""
+        out = np.full((len(X), len(self.targets)), np.nan)
+        if valid.any():
+            out[valid] = np.asarray(self.model.predict(X[valid]), dtype=np.float64).reshape(valid.sum(), -1)
+        return out
+
+    def predict(self, formulas)->pd.DataFrame:
+        """predictions for a sequence of formula strings"""
+        formulas = list(formulas)
+        out = self._predict(*self.features(formulas))
+        return pd.DataFrame(out, columns=self.targets, index=pd.Index(formulas, name="Formula"))
+
+    def predict_compositions(self, df)->pd.DataFrame:
+        """
+        predictions for a frame of constituent amounts, such as the
+        output of make_possible_compositions or ft.comp()
+        """
+        extra = df.columns.difference(self.columns)
+        valid = ~(df[extra].fillna(0) != 0).any(axis=1).to_numpy()
+        X = df.reindex(columns=self.columns, fill_value=0).to_numpy(dtype=np.float64)
+        valid &= ~np.isnan(X).any(axis=1)
+        return pd.DataFrame(self._predict(X, valid), columns=self.targets, index=df.index)
+
+    def stream(self, lines, batchsize=65536):
+        """
+        lazily predict formulas read from an iterable of lines, ie an
+        open file, in frames of batchsize rows. blank lines are skipped
+        """
+        formulas = (line.strip() for line in lines)
+        formulas = (formula for formula in formulas if formula)
+        while batch := list(islice(formulas, batchsize)):
+            yield self.predict(batch).reset_index()
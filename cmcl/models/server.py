@@ -0,0 +1,214 @@
+"""
+serve predictions of persisted models over HTTP
+
+single formula requests arriving together are coalesced into micro
+batches, so each batch is featurized and predicted in one call while
+the event loop keeps accepting requests. the parser, its parse cache
+and the models stay warm for the life of the server. only the standard
+library is used, so it runs anywhere cmcl does.
+
+GET  /models                      models, their targets and columns
+GET  /metrics                     latency and throughput of each model
+GET  /predict/<model>?formula=..  one formula
+POST /predict/<model>             {"formula": ..} or {"formulas": [..]}
+
+<model> may be left out when only one model is served.
+
+example:
+server = PredictionServer({"bg": Predictor.load("bg.pkl")})
+asyncio.run(server.serve("127.0.0.1", 8000))
+"""
+import json
+import time
+import asyncio
+import numpy as np
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error"}
+
+class Metrics():
+    """counts and a window of recent latencies and batch sizes"""
+    def __init__(self, window=10000):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+
+    def record(self, latencies):
+        self.requests += len(latencies)
+        self.batches += 1
+        self.latencies.extend(latencies)
+        self.batch_sizes.append(len(latencies))
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        summary = {"requests": self.requests,
+                   "batches": self.batches,
+                   "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+                   "throughput_per_s": self.requests/elapsed,
+                   "latency_ms": None}
+        if self.latencies:
+            p50, p95, p99 = np.percentile(self.latencies, [50, 95, 99])*1000
+            summary["latency_ms"] = {"p50": p50, "p95": p95, "p99": p99}
+        return summary
+
+class MicroBatcher():
+    """
+    queue of formulas for one Predictor. a batch is sent as soon as it
+    holds max_batch formulas or max_wait seconds after its first one
+    arrived, whichever comes first. batches are predicted off the event
+    loop, one at a time
+    """
+    def __init__(self, predictor, max_batch=256, max_wait=0.002):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = Metrics()
+        # made by start(), so it belongs to the loop the server runs in
+        self._queue = None
+
+    def start(self):
+        """make the queue and start batching in the running loop, returns the task"""
+        self._queue = asyncio.Queue()
+        return asyncio.create_task(self.run())
+
+    async def predict(self, formula):
+        """prediction of one formula, {target: value}, None where it has none"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((formula, future, time.perf_counter()))
+        return await future
+
+    def _predict(self, formulas):
+        out = self.predictor.predict(formulas).to_numpy()
+        return [{target: None if np.isnan(value) else float(value)
+                 for target, value in zip(self.predictor.targets, row)}
+                for row in out]
+
+    async def _collect(self):
+        """wait for the next batch"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            try:
+                rows = await loop.run_in_executor(None, self._predict, [f for f, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            now = time.perf_counter()
+            for (_, future, _), row in zip(batch, rows):
+                if not future.done():
+                    future.set_result(row)
+            self.metrics.record([now - start for _, _, start in batch])
+
+class PredictionServer():
+    """HTTP front end to a MicroBatcher per model, models is {name: Predictor}"""
+    def __init__(self, models, max_batch=256, max_wait=0.002):
+        self.batchers = {name: MicroBatcher(predictor, max_batch, max_wait)
+                         for name, predictor in models.items()}
+        self._tasks = []
+
+    async def start(self, host="127.0.0.1", port=8000):
+        """start the batchers and listen, returns the asyncio.Server"""
+        self._tasks = [batcher.start() for batcher in self.batchers.values()]
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def _batcher(self, path):
+        """batcher named by /predict/<name>, or the only one"""
+        name = path[len("/predict"):].strip("/")
+        if not name and len(self.batchers) == 1:
+            return next(iter(self.batchers.values()))
+        return self.batchers.get(name)
+
+    async def route(self, method, target, body):
+        """status and json payload of one request"""
+        url = urlsplit(target)
+        if url.path == "/metrics":
+            return 200, {name: batcher.metrics.summary() for name, batcher in self.batchers.items()}
+        if url.path == "/models":
+            return 200, {name: {"targets": batcher.predictor.targets,
+                                "columns": batcher.predictor.columns}
+                         for name, batcher in self.batchers.items()}
+        if not url.path.startswith("/predict"):
+            return 404, {"error": f"no route {url.path}"}
+        batcher = self._batcher(url.path)
+        if batcher is None:
+            return 404, {"error": f"no model at {url.path}", "models": list(self.batchers)}
+        if method == "GET":
+            formulas = parse_qs(url.query).get("formula")
+            if not formulas:
+                return 400, {"error": "missing formula parameter"}
+            return 200, dict(formula=formulas[0], **await batcher.predict(formulas[0]))
+        if method != "POST":
+            return 405, {"error": f"{method} not allowed"}
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"error": "body is not json"}
+        if "formula" in request:
+            return 200, dict(formula=request["formula"], **await batcher.predict(request["formula"]))
+        if "formulas" in request:
+            # each joins the queue on its own, so they share batches with others
+            rows = await asyncio.gather(*map(batcher.predict, request["formulas"]))
+            return 200, [dict(formula=f, **row) for f, row in zip(request["formulas"], rows)]
+        return 400, {"error": "expected formula or formulas"}
+
+    async def handle(self, reader, writer):
+        """serve the requests of one connection, kept alive unless asked otherwise"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, version = line.decode("latin-1").split()
+                headers = {}
+                while (header := await reader.readline()).strip():
+                    key, _, value = header.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                try:
+                    status, payload = await self.route(method, target, body)
+                except Exception as e:
+                    status, payload = 500, {"error": repr(e)}
+                data = json.dumps(payload).encode()
+                close = (headers.get("connection", "").lower() == "close"
+                         or version == "HTTP/1.0")
+                head = [f"HTTP/1.1 {status} {reasons[status]}",
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(data)}"]
+                if close:
+                    head.append("Connection: close")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
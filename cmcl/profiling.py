@@ -0,0 +1,142 @@
+"""
+opt-in profiling of the featurization pipeline, stage by stage
+
+with profiling() as prof:
+    df.ft.comp()
+prof.frame()
+
+every stage records its calls, wall time, rows processed, cache hits
+and misses and, with profiling(memory=True), bytes left allocated by
+it as traced by tracemalloc. stages nest, ie "comp.parse" runs inside
+"ft.comp", and each reports its own total.
+
+while disabled a stage costs one flag check and returns a shared no-op
+context, so instrumentation stays in place at negligible cost. stages
+run in executor processes are not recorded, their parent stage is.
+"""
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+enabled = False
+_memory = False
+_tracing = False
+_lock = threading.Lock()
+# stage -> [calls, seconds, rows, hits, misses, bytes]
+_records = {}
+
+fields = ["calls", "seconds", "rows", "cache_hits", "cache_misses", "alloc_bytes"]
+
+class _NoStage():
+    """what stage returns while profiling is disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, rows=0, hits=0, misses=0):
+        pass
+
+_nostage = _NoStage()
+
+class _Stage():
+    """times one run of a stage and adds it to the registry on exit"""
+    __slots__ = ("name", "rows", "hits", "misses", "start", "alloc")
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        self.alloc = tracemalloc.get_traced_memory()[0] if _memory else 0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        alloc = tracemalloc.get_traced_memory()[0] - self.alloc if _memory else 0
+        with _lock:
+            record = _records.setdefault(self.name, [0, 0., 0, 0, 0, 0])
+            record[0] += 1
+            record[1] += seconds
+            record[2] += self.rows
+            record[3] += self.hits
+            record[4] += self.misses
+            record[5] += alloc
+        return False
+
+    def count(self, rows=0, hits=0, misses=0):
+        """add rows processed and cache hits and misses to this run"""
+        self.rows += rows
+        self.hits += hits
+        self.misses += misses
+
+def stage(name, rows=0):
+    """
+    context recording one run of the named stage. the context's count
+    method adds rows and cache hits and misses found along the way
+
+    with stage("comp.parse", rows=len(entries)) as s:
+        s.count(hits=...)
+    """
+    if not enabled:
+        return _nostage
+    return _Stage(name, rows)
+
+def enable(memory=False):
+    """start recording, with memory=True also trace allocations"""
+    global enabled, _memory, _tracing
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        # only stop tracing we started
+        _tracing = True
+    _memory = memory
+    enabled = True
+
+def disable():
+    global enabled, _memory, _tracing
+    if _tracing:
+        tracemalloc.stop()
+    enabled = _memory = _tracing = False
+
+def reset():
+    """forget all records"""
+    with _lock:
+        _records.clear()
+
+def frame():
+    """records as a DataFrame indexed by stage, in order of first run"""
+    import pandas as pd
+    with _lock:
+        df = pd.DataFrame.from_dict({name: list(record) for name, record in _records.items()},
+                                    orient="index", columns=fields)
+    df.index.name = "stage"
+    df["rows_per_s"] = df["rows"].where(df["rows"] > 0) / df["seconds"].where(df["seconds"] > 0)
+    return df
+
+class _Profile():
+    """handle of a profiling() block"""
+    frame = staticmethod(frame)
+    reset = staticmethod(reset)
+
+@contextmanager
+def profiling(memory=False, reset_records=True):
+    """
+    record stages run inside the block. records are cleared on entry
+    unless reset_records is False and are kept after exit
+    """
+    if reset_records:
+        reset()
+    was_enabled = enabled
+    enable(memory)
+    try:
+        yield _Profile()
+    finally:
+        if not was_enabled:
+            disable()
@@ -1,6 +1,3 @@
 #!/usr/bin/env bash
-touch ./summary.txt
-for file in $(find ./*/OUTCAR -type f); do
-    grep "TOTEN" $file >> summary.txt
-done
-
+# final energy, band gap and convergence of every ./*/OUTCAR, one row per run
+python -c "from cmcl.features import harvest_outcars; harvest_outcars('.').to_csv('summary.csv')"
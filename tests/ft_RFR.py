@@ -8,7 +8,7 @@ from cmcl.data.frame import SummaryAccessor
 from cmcl.data.frame import TransformAccessor
 from cmcl.data.frame import ModelAccessor
 
-import sqlite3
+from cmcl.data.base import DataRetriever
 from cmcl.data.utils import *
 
 # analysis tools
@@ -18,22 +18,9 @@ import math
 import matplotlib.pyplot as plt
 
 #load data
-conn = sqlite3.connect("/home/panos/MannodiGroup/data/perovskites.db")
-
-sql_string = '''SELECT * 
-                FROM mannodi_agg'''
-mannodi_df = pd.read_sql(sql_string,
-                         conn,
-                         index_col='index')
-
-sql_string = '''SELECT * 
-                FROM almora_agg'''
-almora_df = pd.read_sql(sql_string,
-                        conn,
-                        index_col='index')
-conn.close()
-
-mannodi_df = mannodi_df[["Formula", "sim_cell", "PBE_LC", "PBE_bgType", "PBE_bg_eV", "PBE_dbg_eV", "PBE_FormE_eV", "PBE_DecoE_eV", "dielc", "PV_FOM", "SLME_5um", "SLME_100um", "HSE_LC", "HSE_bgType", "HSE_bg_eV", "HSE_dbg_eV", "HSE_FormE_eV", "HSE_DecoE_eV"]]
+dbpath = "/home/panos/MannodiGroup/data/perovskites.db"
+mannodi_df = DataRetriever(dbpath, "mannodi_agg").query(columns=["Formula", "sim_cell", "PBE_LC", "PBE_bgType", "PBE_bg_eV", "PBE_dbg_eV", "PBE_FormE_eV", "PBE_DecoE_eV", "dielc", "PV_FOM", "SLME_5um", "SLME_100um", "HSE_LC", "HSE_bgType", "HSE_bg_eV", "HSE_dbg_eV", "HSE_FormE_eV", "HSE_DecoE_eV"])
+almora_df = DataRetriever(dbpath, "almora_agg").query()
 
 mcomp = mannodi_df.ft.comp().fillna(0)
 
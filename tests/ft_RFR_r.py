@@ -8,7 +8,7 @@ from cmcl.data.frame import SummaryAccessor
 from cmcl.data.frame import TransformAccessor
 from cmcl.data.frame import ModelAccessor
 
-import sqlite3
+from cmcl.data.base import DataRetriever
 from cmcl.data.utils import *
 
 # analysis tools
@@ -18,35 +18,24 @@ import math
 import matplotlib.pyplot as plt
 
 #load data
-conn = sqlite3.connect("/home/panos/MannodiGroup/data/perovskites.db")
-
-sql_string = '''SELECT * 
-                FROM mannodi_agg'''
-mannodi_df = pd.read_sql(sql_string,
-                         conn,
-                         index_col='index')
-
-sql_string = '''SELECT * 
-                FROM almora_agg'''
-almora_df = pd.read_sql(sql_string,
-                        conn,
-                        index_col='index')
-conn.close()
-
-mannodi_df = mannodi_df[["Formula", "sim_cell", "PBE_LC", "PBE_bgType", "PBE_bg_eV", "PBE_dbg_eV", "PBE_FormE_eV", "PBE_DecoE_eV", "dielc", "PV_FOM", "SLME_5um", "SLME_100um", "HSE_LC", "HSE_bgType", "HSE_bg_eV", "HSE_dbg_eV", "HSE_FormE_eV", "HSE_DecoE_eV"]]
-
-almora_df = almora_df[["Formula", "bg_eV", "PCE%", "Voc_mV", "Jsc_mA/cm2", "FF%"]]
+dbpath = "/home/panos/MannodiGroup/data/perovskites.db"
+mannodi_df = DataRetriever(dbpath, "mannodi_agg").query(columns=["Formula", "sim_cell", "PBE_LC", "PBE_bgType", "PBE_bg_eV", "PBE_dbg_eV", "PBE_FormE_eV", "PBE_DecoE_eV", "dielc", "PV_FOM", "SLME_5um", "SLME_100um", "HSE_LC", "HSE_bgType", "HSE_bg_eV", "HSE_dbg_eV", "HSE_FormE_eV", "HSE_DecoE_eV"])
+almora_df = DataRetriever(dbpath, "almora_agg").query(columns=["Formula", "bg_eV", "PCE%", "Voc_mV", "Jsc_mA/cm2", "FF%"])
 
 #generate features
 mcomp = mannodi_df.ft.comp().fillna(0)
 acomp = almora_df.ft.comp()
 
+#experimental records paired with DFT records of the same composition, however written
+shared = almora_df.ft.join_on_composition(mannodi_df, suffixes=("", "_dft"))
+print(f"{len(shared)} of {len(almora_df)} experimental records have a DFT counterpart")
+
 #create model and results using computational data
 bgm = mannodi_df.PBE_bg_eV.to_frame()
 bgmp, Rmcomp, Rbgm = bgm.model.RFR(mcomp)
 
-#drop non-numeric X AND Y from consideration
-boolindex=acomp.applymap(lambda x: isinstance(x, str)).any(axis=1)
+#drop symbolic X AND Y from consideration
+boolindex=acomp.index.isin(almora_df.ft.sym().index.droplevel(-1))
 acomp = acomp[~boolindex].fillna(0)
 bga = almora_df.bg_eV.to_frame()[~boolindex]
 
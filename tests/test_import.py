@@ -0,0 +1,54 @@
+# import cost budget of cmcl. every cli call and worker process pays it,
+# so heavy dependencies must only be imported when they are used.
+import os
+import sys
+import json
+import subprocess
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+heavy = ["pandas", "numpy", "scipy", "unidecode", "sqlalchemy", "mendeleev", "ase"]
+
+def measure(setup, stmt, value="None"):
+    """
+    seconds and new modules of stmt after setup, and the value of an
+    expression evaluated after it, in a fresh interpreter
+    """
+    code = f"""
+import sys, time, json
+{setup}
+before = set(sys.modules)
+start = time.perf_counter()
+{stmt}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": sorted(set(sys.modules) - before),
+                  "value": {value}}}))
+"""
+    env = dict(os.environ, PYTHONPATH=root)
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out)
+
+def test_import_cmcl():
+    result = measure("", "import cmcl, cmcl.features, cmcl.models")
+    assert not [m for m in heavy if m in result["modules"]]
+    assert len(result["modules"]) <= 20
+    assert result["seconds"] < 0.1
+
+def test_import_cmcl_data_after_pandas():
+    # registering the accessors costs little beyond pandas itself
+    result = measure("import pandas", "import cmcl.data")
+    assert not [m for m in ["scipy", "unidecode", "sqlalchemy", "mendeleev", "ase"]
+                if m in result["modules"]]
+    assert len(result["modules"]) <= 20
+    assert result["seconds"] < 0.1
+
+def test_accessors_registered_in_any_import_order():
+    for stmt in ["import cmcl\nimport pandas", "import pandas\nimport cmcl"]:
+        measure("", stmt + "\nassert hasattr(pandas.DataFrame, 'ft')\n"
+                           "assert hasattr(pandas.DataFrame, 'collect')")
+
+def test_no_logging_configuration():
+    result = measure("import logging", "import pandas, cmcl, cmcl.data, cmcl.features._extract_constituents",
+                     "[repr(handler) for handler in logging.getLogger().handlers]")
+    assert result["value"] == []
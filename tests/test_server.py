@@ -0,0 +1,60 @@
+# the prediction server on localhost, end to end over real sockets
+import json
+import asyncio
+
+from cmcl.models import Predictor, PredictionServer
+
+class Total():
+    """stands in for a fitted model, predicts the sum of each row"""
+    def predict(self, X):
+        return X.sum(axis=1)
+
+async def request(port, method, target, payload=None):
+    """status and json body of one request on a fresh connection"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    head = f"{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+    writer.write(head.encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    while (await reader.readline()).strip():
+        pass
+    data = await reader.read()
+    writer.close()
+    return status, json.loads(data)
+
+def test_server():
+    # built outside the event loop, as the cli does
+    server = PredictionServer({"total": Predictor(Total(), ["Cs", "Pb", "I"], "atoms")},
+                              max_batch=8, max_wait=0.01)
+
+    async def main():
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            # an idle batcher first, then traffic
+            await asyncio.sleep(0.05)
+            assert await request(port, "GET", "/predict?formula=CsPbI3") == \
+                (200, {"formula": "CsPbI3", "atoms": 5.0})
+            status, rows = await request(port, "POST", "/predict/total",
+                                         {"formulas": ["CsPbI3", "Cs2PbI6", "MAPbI3", "Cs(Pb"]})
+            assert status == 200
+            assert [row["atoms"] for row in rows] == [5.0, 9.0, None, None]
+            # concurrent single requests share batches
+            results = await asyncio.gather(*(request(port, "GET", "/predict?formula=CsPbI3")
+                                             for _ in range(16)))
+            assert all(status == 200 and row["atoms"] == 5.0 for status, row in results)
+            status, models = await request(port, "GET", "/models")
+            assert models == {"total": {"targets": ["atoms"], "columns": ["Cs", "Pb", "I"]}}
+            status, metrics = await request(port, "GET", "/metrics")
+            assert metrics["total"]["requests"] == 21
+            assert metrics["total"]["batches"] < 21
+            assert (await request(port, "GET", "/predict/other?formula=CsPbI3"))[0] == 404
+            assert (await request(port, "POST", "/predict", {}))[0] == 400
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            for task in server._tasks:
+                task.cancel()
+
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+# deduplicating writes of DataStasher
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from cmcl.data.base import DataStasher, hash_col
+
+def stored(dbpath, tblname="t"):
+    with sqlite3.connect(dbpath) as conn:
+        df = pd.read_sql(f'SELECT * FROM "{tblname}"', conn)
+    return df.drop(columns=[hash_col, "index"])
+
+def test_rewriting_a_frame_stores_it_once(tmp_path):
+    stash = DataStasher(str(tmp_path / "t.db"), "t")
+    df = pd.DataFrame({"Formula": ["CsPbI3", "MAPbI3"], "bg": [1.7, 1.6]})
+    assert stash.write(df) == 2
+    assert stash.write(df) == 0
+    # nor does the index matter
+    assert stash.write(df.set_axis([5, 6])) == 0
+    assert len(stored(tmp_path / "t.db")) == 2
+
+def test_reordered_columns_are_the_same_rows(tmp_path):
+    stash = DataStasher(str(tmp_path / "t.db"), "t")
+    df = pd.DataFrame({"Formula": ["CsPbI3"], "bg": [1.7], "n": [4]})
+    assert stash.write(df) == 1
+    assert stash.write(df[["n", "bg", "Formula"]]) == 0
+
+def test_same_values_under_other_columns_are_kept(tmp_path):
+    stash = DataStasher(str(tmp_path / "t.db"), "t")
+    assert stash.write(pd.DataFrame({"Formula": ["CsPbI3"], "PBE_bg": [1.5]})) == 1
+    assert stash.write(pd.DataFrame({"Formula": ["CsPbI3"], "HSE_bg": [1.5]})) == 1
+    df = stored(tmp_path / "t.db")
+    assert df["PBE_bg"].tolist()[0] == 1.5 and df["HSE_bg"].tolist()[1] == 1.5
+    # a frame without a column is the row with it null
+    assert stash.write(pd.DataFrame({"Formula": ["CsPbI3"], "PBE_bg": [1.5],
+                                     "HSE_bg": [np.nan]})) == 0
+
+def test_values_hash_as_stored_not_by_dtype(tmp_path):
+    stash = DataStasher(str(tmp_path / "t.db"), "t")
+    # n arrives as float64, then int64, then Int64
+    assert stash.write(pd.DataFrame({"Formula": ["CsPbI3", "MAPbI3"], "n": [1, np.nan]})) == 2
+    assert stash.write(pd.DataFrame({"Formula": ["CsPbI3"], "n": [1]})) == 0
+    assert stash.write(pd.DataFrame({"Formula": ["MAPbI3"],
+                                     "n": pd.array([None], dtype="Int64")})) == 0
+    assert len(stored(tmp_path / "t.db")) == 2
+
+def test_large_integers_are_distinct(tmp_path):
+    stash = DataStasher(str(tmp_path / "t.db"), "t")
+    ids = [2**62, 2**62 + 1]
+    assert stash.write(pd.DataFrame({"id": ids})) == 2
+    assert stash.write(pd.DataFrame({"id": ids[::-1]})) == 0
+    assert sorted(stored(tmp_path / "t.db")["id"]) == ids